@@ -0,0 +1,636 @@
+# api/bench.py
+# Mediciones locales con datos sintéticos. Por defecto usa SQLite en memoria:
+#   cd api && python bench.py leaderboard
+#   cd api && python bench.py routes --users 100 --days 90
+#   cd api && python bench.py scaling
+# Para otra base usar BENCH_DATABASE_URL (nunca DATABASE_URL: el bench borra las tablas), ej.
+#   BENCH_DATABASE_URL=postgresql://localhost/pips_bench python bench.py routes
+# Solo números (tiempos, consultas, filas/s): la corrección se verifica en tests/ (python -m pytest).
+import io
+import os
+import sys
+import math
+import time
+import random
+import inspect
+import argparse
+import tracemalloc
+import statistics
+import subprocess
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+os.environ["DATABASE_URL"] = os.environ.get("BENCH_DATABASE_URL", "sqlite://")
+
+import pytz
+from sqlalchemy import event, func
+from werkzeug.security import generate_password_hash, check_password_hash
+
+import index
+from index import app, db, DIFFICULTIES, STAMP_RULES, build_leaderboard, build_stats, migrate_schema
+from index import fill_missing_results, rebuild_rollup, recent_requests
+from index import User, Result, Stamp, UserStamp, DailyStanding
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(db.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def reset_db():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+
+def seed(n_users, n_days, seed_value=0):
+    rnd = random.Random(seed_value)
+    today = date.today()
+
+    stamps = [Stamp(name=name, image="racha_facil", description="-", category=1) for name in STAMP_RULES]
+    db.session.add_all(stamps)
+    users = [User(username=f"user{i}", password_hash="-", current_streak=rnd.randint(0, 60),
+                  last_played=today) for i in range(n_users)]
+    db.session.add_all(users)
+    db.session.flush()
+
+    results = []
+    for u in users:
+        for d in range(1, n_days + 1):
+            for diff in DIFFICULTIES:
+                total = rnd.randint(5, 600)
+                results.append({"user_id": u.id, "difficulty": diff, "date": today - timedelta(days=d),
+                                "minutes": total // 60, "seconds": total % 60})
+        for s in rnd.sample(stamps, rnd.randint(0, len(stamps) // 2)):
+            db.session.add(UserStamp(user_id=u.id, stamp_id=s.id))
+    db.session.execute(Result.__table__.insert(), results)
+    db.session.commit()
+    rebuild_rollup()
+
+
+def bench_leaderboard():
+    # la cantidad de consultas no debe depender de la cantidad de usuarios
+    for n_users in (5, 50, 500):
+        reset_db()
+        seed(n_users, 10)
+        for sort in ("streak", "avg_easy", "avg_medium", "avg_hard", "stamps", "username"):
+            start = time.perf_counter()
+            with QueryCounter() as qc:
+                board = build_leaderboard(sort=sort, page=1)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"users={n_users:<4} sort={sort:<10} queries={qc.count} rows={len(board['data'])} {elapsed:.1f}ms")
+
+
+def bench_stats():
+    # el tiempo por resultado debe mantenerse ~constante al crecer usuarios y días
+    per_row = []
+    for n_users, n_days in ((10, 30), (20, 60), (40, 120), (80, 240)):
+        reset_db()
+        seed(n_users, n_days)
+        rows = n_users * n_days * len(DIFFICULTIES)
+        build_stats()  # calentar
+        start = time.perf_counter()
+        for _ in range(3):
+            build_stats()
+        elapsed = (time.perf_counter() - start) / 3
+        per_row.append(elapsed / rows * 1e6)
+        window = time.perf_counter()
+        build_stats(days=30)
+        window = time.perf_counter() - window
+        print(f"users={n_users:<3} days={n_days:<3} rows={rows:<6} {elapsed * 1000:7.1f}ms "
+              f"{per_row[-1]:.2f}us/row  (30 días: {window * 1000:.1f}ms)")
+
+    print(f"us/fila: {per_row[-1] / per_row[0]:.2f}x de la base más chica a la más grande (≈1 es lineal)")
+
+
+def explain(stmt):
+    sql = str(stmt.compile(db.engine, compile_kwargs={"literal_binds": True}))
+    if db.engine.dialect.name == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        # con tablas chicas Postgres prefiere seq scan aunque exista el índice
+        db.session.execute(db.text("SET enable_seqscan = off"))
+        prefix = "EXPLAIN "
+    return " | ".join(str(row[-1]) for row in db.session.execute(db.text(prefix + sql)))
+
+
+def bench_plans():
+    # planes de las consultas calientes antes y después de migrate_schema()
+    reset_db()
+    seed(50, 30)
+    day = date.today() - timedelta(days=1)
+    hot = {
+        "result (user, date, diff)": db.select(Result).where(
+            Result.user_id == 1, Result.date == day, Result.difficulty == "Easy"),
+        "result (date, diff)": db.select(Result).where(Result.date == day, Result.difficulty == "Easy"),
+        "user_stamp (user, stamp)": db.select(UserStamp).where(UserStamp.user_id == 1, UserStamp.stamp_id == 1),
+    }
+    for model in (Result, UserStamp):
+        for index in model.__table__.indexes:
+            index.drop(db.engine)
+    before = {name: explain(stmt) for name, stmt in hot.items()}
+
+    migrate_schema()
+    after = {name: explain(stmt) for name, stmt in hot.items()}
+
+    for name in hot:
+        print(f"{name}\n  antes:   {before[name]}\n  después: {after[name]}")
+
+
+COLD_START = """
+import os, time
+start = time.perf_counter()
+import index
+if os.environ.get("BENCH_CREATE_ALL"):
+    with index.app.app_context():
+        index.db.create_all()
+response = index.app.test_client().get("/")
+print((time.perf_counter() - start) * 1000, response.status_code)
+"""
+
+
+def bench_coldstart(runs=7):
+    # import -> primer respuesta en un proceso nuevo, con y sin el DDL que antes corría al importar
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=os.environ.get("BENCH_DATABASE_URL", f"sqlite:///{tmp}/cold.db"))
+        here = os.path.dirname(os.path.abspath(__file__))
+
+        def run(extra):
+            out = subprocess.run([sys.executable, "-c", COLD_START], cwd=here, env=dict(env, **extra),
+                                 capture_output=True, text=True, check=True).stdout.split()
+            return float(out[0])
+
+        run({"BENCH_CREATE_ALL": "1"})  # crear el esquema una vez
+        for label, extra in (("create_all al importar", {"BENCH_CREATE_ALL": "1"}), ("init-db explícito", {})):
+            times = [run(extra) for _ in range(runs)]
+            print(f"{label:<24} p50={statistics.median(times):7.1f}ms  min={min(times):7.1f}ms  max={max(times):7.1f}ms")
+
+
+def bench_downsample(budget=100):
+    # series largas: cuántas fechas y puntos quedan con el presupuesto, y cuánto cuesta reducir
+    reset_db()
+    seed(8, 1000)
+    full = build_stats()
+    start = time.perf_counter()
+    reduced = build_stats(points=budget)
+    elapsed = (time.perf_counter() - start) * 1000
+    for diff in DIFFICULTIES:
+        print(f"{diff:<6} fechas {len(full[diff]['dates'])} -> {len(reduced[diff]['dates'])}, "
+              f"máx. puntos por serie {max(len(ds['data']) for ds in reduced[diff]['datasets'])}")
+    print(f"build_stats(points={budget}): {elapsed:.1f}ms")
+
+
+# (nombre, método, ruta); las rutas cacheadas se miden con la caché vacía en cada request
+ROUTES = [
+    ("dashboard", "GET", "/dashboard"),
+    ("leaderboard", "GET", "/leaderboard"),
+    ("leaderboard avg_hard", "GET", "/leaderboard?sort=avg_hard"),
+    ("stats", "GET", "/stats"),
+    ("api/stats", "GET", "/api/stats?points=180"),
+    ("api/stats 30d", "GET", "/api/stats?days=30&points=180"),
+    ("personalstats", "GET", "/personalstats"),
+    ("api/personalstats", "GET", "/api/personalstats?points=180"),
+    ("api/personalstats 30d", "GET", "/api/personalstats?days=30&points=180"),
+    ("api/leaderboard", "GET", "/api/leaderboard"),
+    ("estampillas", "GET", "/estampillas"),
+    ("submit (GET)", "GET", "/submit"),
+    ("submit (POST)", "POST", "/submit"),
+]
+
+
+def clear_cache():
+    if hasattr(index.cache, "entries"):
+        index.cache.entries.clear()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def measure_routes(repeat):
+    # cada request con un usuario distinto; los POST a /submit son el primer envío del día de ese usuario
+    client = app.test_client()
+    user_ids = [u for (u,) in db.session.query(User.id).order_by(User.id)]
+    rnd = random.Random(1)
+    report = {}
+    for name, method, path in ROUTES:
+        latencies, queries, peaks = [], [], []
+        posters = iter(user_ids)
+        for i in range(repeat):
+            user_id = next(posters, None) if method == "POST" else rnd.choice(user_ids)
+            if user_id is None:
+                break
+            with client.session_transaction() as sess:
+                sess["user_id"] = user_id
+            form = {"easy_sec": "20", "medium_sec": "40", "hard_min": "1", "hard_sec": "5"} if method == "POST" else None
+            clear_cache()
+            # la última repetición mide memoria (tracemalloc frena el resto)
+            trace = i == repeat - 1
+            if trace:
+                tracemalloc.start()
+            # contexto propio: si no, el request reutiliza el del bench y g (usuario, data_version) sobrevive
+            with app.app_context():
+                start = time.perf_counter()
+                response = client.open(path, method=method, data=form)
+            elapsed = (time.perf_counter() - start) * 1000
+            if trace:
+                peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+                tracemalloc.stop()
+            else:
+                latencies.append(elapsed)
+            assert response.status_code in (200, 302), f"{path}: {response.status_code}"
+            queries.append(recent_requests[-1]["queries"])
+        report[name] = {
+            "p50": statistics.median(latencies) if latencies else float("nan"),
+            "p95": percentile(latencies, 0.95) if latencies else float("nan"),
+            "queries": max(queries),
+            "peak_kb": max(peaks) if peaks else float("nan"),
+        }
+    return report
+
+
+def bench_routes(users=50, days=60, repeat=20):
+    reset_db()
+    seed(users, days)
+    print(f"{db.engine.dialect.name}: {users} usuarios × {days} días × {len(DIFFICULTIES)} dificultades")
+    report = measure_routes(repeat)
+    print(f"{'ruta':<22}{'p50 ms':>9}{'p95 ms':>9}{'consultas':>11}{'pico KB':>10}")
+    for name, r in report.items():
+        print(f"{name:<22}{r['p50']:>9.1f}{r['p95']:>9.1f}{r['queries']:>11}{r['peak_kb']:>10.0f}")
+    return report
+
+
+def bench_scaling(repeat=7):
+    # barre N usuarios y D días; exponente = log(t2/t1) / log(filas2/filas1), > 1.2 es superlineal
+    sizes = [(20, 30), (40, 60), (80, 120)]
+    runs = []
+    for users, days in sizes:
+        reset_db()
+        seed(users, days)
+        runs.append((users * days, measure_routes(repeat)))
+        print(f"  medido {users}×{days}")
+
+    print(f"{'ruta':<22}" + "".join(f"{f'{u}×{d}':>10}" for u, d in sizes) + f"{'exponente':>11}")
+    superlinear = []
+    for name, _, _ in ROUTES:
+        times = [report[name]["p50"] for _, report in runs]
+        (rows1, _), (rows2, _) = runs[0], runs[-1]
+        exponent = math.log(times[-1] / times[0]) / math.log(rows2 / rows1) if times[0] > 0 else float("nan")
+        flag = "  ⚠️" if exponent > 1.2 else ""
+        if flag:
+            superlinear.append(name)
+        print(f"{name:<22}" + "".join(f"{t:>10.1f}" for t in times) + f"{exponent:>11.2f}{flag}")
+    print("✅ scaling: ninguna ruta superlineal" if not superlinear else f"⚠️ superlineales: {', '.join(superlinear)}")
+
+
+def bench_analytics(users=200, days=120):
+    # tiempo de percentiles y posiciones por tamaño de página
+    reset_db()
+    seed(users, days)
+    # un día con ausentes: el backfill les pone el peor tiempo y no debe mover las medianas
+    day = date.today() - timedelta(days=days + 1)
+    db.session.execute(Result.__table__.insert(), [
+        {"user_id": user_id, "difficulty": diff, "date": day, "minutes": 0, "seconds": 30}
+        for user_id in (1, 2) for diff in DIFFICULTIES
+    ])
+    db.session.commit()
+    fill_missing_results(day)
+    db.session.commit()
+
+    for page_size in (10, 50, users):
+        ids = list(range(1, page_size + 1))
+        start = time.perf_counter()
+        with QueryCounter() as qc:
+            analytics = index.user_analytics(ids)
+        elapsed = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        index.user_analytics(ids, ranks=False)
+        medians_ms = (time.perf_counter() - start) * 1000
+        print(f"{db.engine.dialect.name}: {page_size:>4} usuarios  queries={qc.count}  "
+              f"con posiciones {elapsed:7.1f}ms  solo medianas {medians_ms:6.1f}ms")
+
+    with_backfill = index.user_analytics([3], exclude_backfilled=False)[3]["Easy"]
+    without = analytics[3]["Easy"]
+    print(f"user 3 Easy: mediana {without['median']:.0f}s sin backfill, {with_backfill['median']:.0f}s con backfill "
+          f"({with_backfill['results'] - without['results']} días completados)")
+
+
+def bench_events(watchers=1000):
+    # una cantidad de consultas por envío que no depende de cuántos miran /events
+    reset_db()
+    seed(50, 10)
+    client = app.test_client()
+    form = {"easy_sec": "20", "medium_sec": "40", "hard_min": "1", "hard_sec": "5"}
+    # un envío previo para que el catálogo de estampillas ya esté en memoria
+    with client.session_transaction() as sess:
+        sess["user_id"] = 4
+    with app.app_context():
+        client.post("/submit", data=form)
+    queries = {}
+    for n, user_id in ((0, 1), (watchers // 10, 2), (watchers, 3)):
+        received = []
+        ready = threading.Barrier(n + 1)
+
+        def watch():
+            events = index.broker.listen(heartbeat=30)
+            topics = set()
+            ready.wait()
+            for event in events:
+                if event is not None:
+                    topics.add(event[1])
+                if topics >= {"leaderboard", "stats"}:
+                    break
+            events.close()
+            received.append(time.perf_counter())
+
+        threads = [threading.Thread(target=watch) for _ in range(n)]
+        for t in threads:
+            t.start()
+        ready.wait()
+        time.sleep(0.05)  # que todos estén esperando en el broker
+        with client.session_transaction() as sess:
+            sess["user_id"] = user_id
+        with app.app_context():
+            start = time.perf_counter()
+            client.post("/submit", data=form)
+            posted = time.perf_counter()
+        for t in threads:
+            t.join()
+        queries[n] = recent_requests[-1]["queries"]
+        fanout = (max(received) - posted) * 1000 if received else 0
+        print(f"{n:>5} oyentes: POST {1000 * (posted - start):6.1f}ms, {queries[n]} consultas, "
+              f"todos recibieron en {fanout:6.1f}ms")
+
+
+
+def bench_standings(users=200, days=365):
+    # leaderboards por rango desde las fotos diarias vs. recalcular puestos desde Result
+    reset_db()
+    seed(users, days)
+    start = time.perf_counter()
+    written = index.rebuild_standings()
+    print(f"rebuild: {written} filas en {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    for range_ in index.STANDINGS_RANGES:
+        start = time.perf_counter()
+        with QueryCounter() as qc:
+            index.build_standings(range_)
+        snapshot_ms = (time.perf_counter() - start) * 1000
+        # lo mismo sin fotos: puestos con funciones de ventana sobre Result en cada request
+        n_days = index.STANDINGS_RANGES[range_]
+        since = date.today() - timedelta(days=n_days) if n_days else date.min
+        start = time.perf_counter()
+        ranked = index.standings_select(Result.date >= since).subquery()
+        db.session.execute(db.select(ranked.c.user_id, func.count()).group_by(ranked.c.user_id)).all()
+        raw_ms = (time.perf_counter() - start) * 1000
+        print(f"{range_:<6} fotos {snapshot_ms:7.1f}ms ({qc.count} consultas)   desde Result {raw_ms:7.1f}ms")
+
+    # backfill del día con la mitad de los usuarios sin jugar: completa resultados y escribe la foto
+    day = date.today()
+    db.session.execute(Result.__table__.insert(), [
+        {"user_id": user_id, "difficulty": diff, "date": day, "minutes": 0, "seconds": 10 + user_id}
+        for user_id in range(1, users // 2 + 1) for diff in DIFFICULTIES
+    ])
+    db.session.commit()
+    start = time.perf_counter()
+    fill_missing_results(day)
+    print(f"backfill + foto del día: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+# varias pestañas del mismo usuario enviando a la vez: parciales que juntas completan el día
+TABS = [
+    {"easy_sec": "20"},
+    {"medium_sec": "40"},
+    {"hard_min": "1", "hard_sec": "5"},
+    {"easy_sec": "21", "medium_sec": "41", "hard_min": "1", "hard_sec": "6"},
+]
+
+
+def rerun_on_file(name, **options):
+    # con SQLite en memoria todos los hilos comparten una conexión: se corre sobre un archivo
+    if db.engine.url.database not in (None, "", ":memory:"):
+        return False
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, BENCH_DATABASE_URL=f"sqlite:///{tmp}/{name}.db")
+        args = [arg for k, v in options.items() for arg in (f"--{k}", str(v))]
+        subprocess.run([sys.executable, os.path.abspath(__file__), name, *args], env=env, check=True)
+    return True
+
+
+def bench_concurrency(users=20, rounds=3):
+    if rerun_on_file("concurrency", users=users, rounds=rounds):
+        return
+
+    for _ in range(rounds):
+        reset_db()
+        seed(users, 10)
+        today = datetime.now(pytz.timezone("Europe/Paris")).date()
+        # mitad viene de ayer (la racha sube una vez), mitad cortó (vuelve a 1)
+        for u in User.query:
+            u.last_played = today - timedelta(days=1 if u.id % 2 else 3)
+        Result.query.filter(Result.date >= today).delete()
+        db.session.commit()
+        rebuild_rollup()
+        before = {u.id: (u.current_streak, u.last_played) for u in User.query}
+        db.session.remove()
+
+        n_requests = len(recent_requests)
+        barrier = threading.Barrier(len(before) * len(TABS))
+        errors = []
+
+        def post(user_id, form):
+            try:
+                with app.app_context():
+                    client = app.test_client()
+                    with client.session_transaction() as sess:
+                        sess["user_id"] = user_id
+                    barrier.wait()
+                    client.post("/submit", data=form)
+            except Exception as e:
+                errors.append(repr(e))
+
+        threads = [threading.Thread(target=post, args=(user_id, form)) for user_id in before for form in TABS]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if errors:
+            print(f"{len(errors)} errores, p. ej. {errors[0]}")
+        posts = [r["queries"] for r in list(recent_requests)[n_requests:] if r["endpoint"] == "submit"]
+        print(f"{db.engine.dialect.name}: {len(threads)} POST concurrentes ({len(before)} usuarios × {len(TABS)} pestañas) "
+              f"en {elapsed:.0f}ms, consultas por POST p50={statistics.median(posts):.0f} max={max(posts)}")
+
+
+def login(ip, username, password):
+    with app.app_context():
+        client = app.test_client()
+        return client.post("/", data={"username": username, "password": password},
+                           environ_base={"REMOTE_ADDR": ip}).status_code
+
+
+def run_login_burst(workers, attempts, legit):
+    # ráfaga de credential stuffing (cuentas reales, contraseña equivocada, pocas IPs) mezclada con
+    # logins legítimos, repartida entre `workers` hilos como los workers de gunicorn
+    index.login_limiter = index.SlidingWindowLimiter()
+    jobs = [("attack", f"10.0.0.{i % 2}", f"victim{i % 50}", "wrong") for i in range(attempts)]
+    for i in range(legit):
+        jobs.insert((i + 1) * len(jobs) // (legit + 1), ("legit", f"10.1.0.{i}", f"legit{i}", "secret"))
+
+    hashing = []
+    check = index.check_password_hash
+
+    def timed_check(pwhash, password):
+        start = time.perf_counter()
+        try:
+            return check(pwhash, password)
+        finally:
+            hashing.append(time.perf_counter() - start)
+
+    def run(kind, ip, username, password):
+        # latencia desde el inicio de la ráfaga: incluye la espera en la cola hasta que hay un worker libre
+        status = login(ip, username, password)
+        return kind, status, (time.perf_counter() - start) * 1000
+
+    index.check_password_hash = timed_check
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(lambda job: run(*job), jobs))
+    finally:
+        index.check_password_hash = check
+    elapsed = time.perf_counter() - start
+    statuses, latencies = defaultdict(list), []
+    for kind, status, ms in results:
+        statuses[kind].append(status)
+        if kind == "legit":
+            latencies.append(ms)
+    return {
+        "elapsed": elapsed,
+        "statuses": statuses,
+        "hashes": len(hashing),
+        "hash_seconds": sum(hashing),
+        "legit_ms": latencies,
+    }
+
+
+def bench_login(workers=4, attempts=100):
+    if rerun_on_file("login", workers=workers, attempts=attempts):
+        return
+    reset_db()
+    today = date.today()
+    method = index.PASSWORD_HASH_METHOD
+    pwhash = generate_password_hash("secret", method)
+    db.session.add_all([User(username=f"victim{i}", password_hash=pwhash, current_streak=0, last_played=today)
+                        for i in range(50)])
+    db.session.add_all([User(username=f"legit{i}", password_hash=pwhash, current_streak=0, last_played=today)
+                        for i in range(10)])
+    db.session.commit()
+
+    limits = (index.LOGIN_MAX_PER_IP, index.LOGIN_MAX_PER_USER, index.LOGIN_MAX_PER_USERNAME)
+    index.SLOW_REQUEST_MS = float("inf")  # cada login tarda lo que el hash: no loguearlos como lentos
+
+    start = time.perf_counter()
+    check_password_hash(pwhash, "secret")
+    print(f"{method}: {(time.perf_counter() - start) * 1000:.0f}ms por hash; "
+          f"{workers} workers, {attempts} intentos de ataque desde 2 IPs + 10 logins legítimos")
+    try:
+        for label, current in (("sin límite", (0, 0, 0)), ("con límite", limits)):
+            index.LOGIN_MAX_PER_IP, index.LOGIN_MAX_PER_USER, index.LOGIN_MAX_PER_USERNAME = current
+            r = run_login_burst(workers, attempts, legit=10)
+            total = sum(len(v) for v in r["statuses"].values())
+            legit_ok = r["statuses"]["legit"].count(302)
+            print(f"  {label:<11} {r['elapsed']:6.2f}s  {total / r['elapsed']:6.1f} req/s  "
+                  f"hashes={r['hashes']:<4} 429={r['statuses']['attack'].count(429):<4} "
+                  f"{r['hash_seconds']:5.1f}s de workers en hash  "
+                  f"legítimos {legit_ok}/10 p50={statistics.median(r['legit_ms']):.0f}ms max={max(r['legit_ms']):.0f}ms")
+    finally:
+        index.LOGIN_MAX_PER_IP, index.LOGIN_MAX_PER_USER, index.LOGIN_MAX_PER_USERNAME = limits
+
+
+def bench_import(users=200, days=365):
+    # filas/s de export y de import (export -> borrar -> import)
+    reset_db()
+    seed(users, days)
+    tables = ["results", "streaks", "user_stamps"]
+
+    def export_all(fmt):
+        return {table: "".join(index.export_lines(table, fmt)) for table in tables}
+
+    for fmt in ("csv", "ndjson"):
+        start = time.perf_counter()
+        exported = export_all(fmt)
+        export_s = time.perf_counter() - start
+        rows = exported["results"].count("\n") - (fmt == "csv")
+
+        db.session.execute(db.delete(UserStamp))
+        db.session.execute(db.delete(DailyStanding))
+        db.session.execute(db.delete(Result))
+        db.session.execute(db.delete(index.ResultRollup))
+        db.session.execute(db.delete(User))
+        db.session.commit()
+
+        reports = {}
+        for table in tables:
+            lines = io.StringIO(exported[table])
+            reports[table] = index.import_rows(table, index.read_rows(lines, fmt), create_users=True)
+
+
+        report = reports["results"]
+        print(f"{fmt:<6} {rows:,} resultados: export {rows / export_s:,.0f} filas/s, "
+              f"import {report['read'] / report['seconds']:,.0f} filas/s ({report['seconds']:.2f}s)")
+
+
+BENCHES = {
+    "leaderboard": bench_leaderboard,
+    "stats": bench_stats,
+    "plans": bench_plans,
+    "coldstart": bench_coldstart,
+    "downsample": bench_downsample,
+    "routes": bench_routes,
+    "scaling": bench_scaling,
+    "concurrency": bench_concurrency,
+    "analytics": bench_analytics,
+    "events": bench_events,
+    "standings": bench_standings,
+    "login": bench_login,
+    "import": bench_import,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("names", nargs="*", help=f"por defecto todos: {', '.join(BENCHES)}")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--days", type=int)
+    parser.add_argument("--repeat", type=int)
+    parser.add_argument("--rounds", type=int)
+    parser.add_argument("--watchers", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--attempts", type=int)
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHES)
+    if unknown:
+        parser.error(f"bench desconocido: {', '.join(sorted(unknown))}")
+    options = {k: v for k, v in vars(args).items() if k != "names" and v is not None}
+
+    with app.app_context():
+        for name in args.names or list(BENCHES):
+            bench = BENCHES[name]
+            accepted = inspect.signature(bench).parameters
+            bench(**{k: v for k, v in options.items() if k in accepted})
@@ -1,16 +1,33 @@
-from flask import Flask, render_template, request, redirect, url_for, session, g, flash
+from flask import Flask, render_template, request, redirect, url_for, session, g, flash, has_request_context
+from flask import abort, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
+from werkzeug.middleware.proxy_fix import ProxyFix
+from datetime import date, datetime, timedelta, timezone
+from collections import OrderedDict, defaultdict, deque
+from bisect import bisect_left
+from functools import wraps
 import os
+import io
+import csv
+import sys
+import json
+import math
+import hashlib
+import time
+import threading
+import click
 import pytz
 
 # from dotenv import load_dotenv
 
 # load_dotenv()
 
-last_update_date = None
-
 app = Flask(__name__, template_folder="../templates", static_folder="../static")
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "supersecretkey")
 
@@ -21,6 +38,37 @@ if db_url and db_url.startswith("postgres://"):
 app.config["SQLALCHEMY_DATABASE_URI"] = db_url
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+def engine_options(url):
+    # perfil del engine según el entorno:
+    #   DB_POOL=null   -> sin pool propio (serverless detrás de un pooler externo, ej. Neon -pooler)
+    #   DB_POOL=queue  -> QueuePool normal (proceso de larga vida, ej. gunicorn)
+    if not url or url.startswith("sqlite"):
+        return {}
+    pool = os.environ.get("DB_POOL", "null" if os.environ.get("VERCEL") else "queue")
+    options = {"pool_pre_ping": env_flag("DB_POOL_PRE_PING", True)}
+    if pool == "null":
+        options["poolclass"] = NullPool
+    else:
+        options["pool_size"] = int(os.environ.get("DB_POOL_SIZE", 5))
+        options["max_overflow"] = int(os.environ.get("DB_MAX_OVERFLOW", 5))
+        options["pool_recycle"] = int(os.environ.get("DB_POOL_RECYCLE", 300))
+        options["pool_timeout"] = int(os.environ.get("DB_POOL_TIMEOUT", 10))
+
+    connect_args = {"connect_timeout": int(os.environ.get("DB_CONNECT_TIMEOUT", 5))}
+    statement_timeout = os.environ.get("DB_STATEMENT_TIMEOUT_MS")
+    if statement_timeout:
+        connect_args["options"] = f"-c statement_timeout={int(statement_timeout)}"
+    options["connect_args"] = connect_args
+    return options
+
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(db_url)
+
 db = SQLAlchemy(app)
 
 # Modelos
@@ -32,18 +80,29 @@ class User(db.Model):
     last_played = db.Column(db.Date, nullable=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, PASSWORD_HASH_METHOD)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def password_outdated(self):
+        # hash creado con otros parámetros: se rehace en el próximo login correcto
+        return self.password_hash.split("$", 1)[0] != password_hash_prefix()
+
 class Result(db.Model):
+    __table_args__ = (
+        db.Index("uq_result_user_date_difficulty", "user_id", "date", "difficulty", unique=True),
+        db.Index("ix_result_date_difficulty", "date", "difficulty"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     difficulty = db.Column(db.String(20), nullable=False)
     date = db.Column(db.Date, nullable=False)
     minutes = db.Column(db.Integer, nullable=False)
     seconds = db.Column(db.Integer, nullable=False)
+    # insertado por fill_missing_results() (el usuario no jugó)
+    backfilled = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     
 
 class Stamp(db.Model):
@@ -54,97 +113,1978 @@ class Stamp(db.Model):
     category = db.Column(db.Integer, nullable=False)
 
 class UserStamp(db.Model):
+    __table_args__ = (
+        db.Index("uq_user_stamp_user_stamp", "user_id", "stamp_id", unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     stamp_id = db.Column(db.Integer, db.ForeignKey('stamp.id'), nullable=False)
 
-def fill_missing_results():
-    local_tz = pytz.timezone("Europe/Paris")
-    today = datetime.now(local_tz).date()
-    yesterday = today - timedelta(days=1)
-
-    difficulties = ["Easy", "Medium", "Hard"]
-    users = User.query.all()
-
-    for diff in difficulties:
-        # peor resultado del día anterior (mayor tiempo total)
-        worst = (
-            Result.query.filter_by(date=yesterday, difficulty=diff)
-            .order_by(Result.minutes.desc(), Result.seconds.desc())
-            .first()
+class ResultRollup(db.Model):
+    # agregados por (usuario, dificultad), mantenidos en cada inserción de Result
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    difficulty = db.Column(db.String(20), primary_key=True)
+    results = db.Column(db.Integer, nullable=False)
+    total_seconds = db.Column(db.Integer, nullable=False)
+    best_seconds = db.Column(db.Integer, nullable=False)
+    last_date = db.Column(db.Date, nullable=False)
+
+class DataVersion(db.Model):
+    # contador que cambia cada vez que cambian los resultados
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class JobMarker(db.Model):
+    # último día procesado por cada tarea batch (ej. "backfill")
+    name = db.Column(db.String(50), primary_key=True)
+    last_date = db.Column(db.Date, nullable=True)
+
+class DailyStanding(db.Model):
+    # foto de cada día cerrado, escrita por el backfill (solo se agregan filas): tiempo y puesto por
+    # dificultad, racha y estampillas del usuario al cierre del día. La clave empieza por la fecha
+    # para que los rangos ("última semana", "último mes") lean solo sus días.
+    __table_args__ = (
+        db.Index("ix_daily_standing_user_date", "user_id", "date"),
+    )
+
+    date = db.Column(db.Date, primary_key=True)
+    difficulty = db.Column(db.String(20), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    seconds = db.Column(db.Integer, nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    backfilled = db.Column(db.Boolean, nullable=False, default=False)
+    streak = db.Column(db.Integer, nullable=False)
+    stamps = db.Column(db.Integer, nullable=False)
+
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+
+# Esquema
+# columnas de la clave única de cada tabla (para ON CONFLICT)
+UNIQUE_KEYS = {
+    User: ["username"],
+    Result: ["user_id", "date", "difficulty"],
+    UserStamp: ["user_id", "stamp_id"],
+    ResultRollup: ["user_id", "difficulty"],
+    DailyStanding: ["date", "difficulty", "user_id"],
+}
+
+def dialect_insert(model):
+    if db.engine.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def insert_ignore(model, values, returning=None):
+    # inserta sin consultar antes; devuelve cuántas filas entraron de verdad
+    # (o la columna `returning` de las filas que entraron)
+    stmt = dialect_insert(model).values(values).on_conflict_do_nothing(index_elements=UNIQUE_KEYS[model])
+    if returning is not None:
+        return db.session.execute(stmt.returning(returning)).scalars().all()
+    return db.session.execute(stmt).rowcount
+
+# columnas agregadas después de crear las tablas: (modelo, columna, DDL)
+ADDED_COLUMNS = [
+    (Result, "backfilled", "BOOLEAN NOT NULL DEFAULT FALSE"),
+]
+
+def migrate_schema():
+    # create_all no altera tablas existentes: agregar columnas, borrar duplicados y crear los índices que falten
+    duplicated = {
+        Result: (Result.user_id, Result.date, Result.difficulty),
+        UserStamp: (UserStamp.user_id, UserStamp.stamp_id),
+    }
+    db.create_all()
+
+    inspector = db.inspect(db.engine)
+    for model, column, ddl in ADDED_COLUMNS:
+        table = model.__tablename__
+        if column not in {c["name"] for c in inspector.get_columns(table)}:
+            db.session.execute(db.text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+            print(f"{table}: columna {column} agregada")
+            if (model, column) == (Result, "backfilled"):
+                # las filas que ya rellenó el backfill quedan como jugadas: recordar hasta qué día
+                last = db.session.query(db.func.max(Result.date)).scalar()
+                if last:
+                    db.session.add(JobMarker(name="legacy_backfill", last_date=last))
+                    print(f"result: filas hasta {last} sin distinguir backfill (recompute pedirá --trust-legacy)")
+    for model, key in duplicated.items():
+        keep = db.select(db.func.min(model.id)).group_by(*key)
+        removed = db.session.execute(db.delete(model).where(model.id.not_in(keep))).rowcount
+        if removed:
+            print(f"{model.__tablename__}: {removed} filas duplicadas eliminadas")
+    db.session.commit()
+
+    for model in duplicated:
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+    if not db.session.query(ResultRollup.user_id).first():
+        rebuild_rollup()
+    if not db.session.query(DailyStanding.date).first() and db.session.query(Result.id).first():
+        print("daily_standing vacía: correr \"flask --app index standings-rebuild\" para las fotos de días pasados")
+
+# Rollup
+ROLLUP_COLUMNS = ["user_id", "difficulty", "results", "total_seconds", "best_seconds", "last_date"]
+
+def rollup_select(*filters):
+    # agregados de Result con las columnas de ResultRollup
+    total_seconds = Result.minutes * 60 + Result.seconds
+    return (
+        db.select(
+            Result.user_id,
+            Result.difficulty,
+            db.func.count(),
+            db.func.sum(total_seconds),
+            db.func.min(total_seconds),
+            db.func.max(Result.date),
         )
+        .where(*filters)
+        .group_by(Result.user_id, Result.difficulty)
+    )
 
-        if not worst:
-            continue  # si nadie jugó esa dificultad
+def add_to_rollup(rows):
+    # rows: lista de dicts o un select (rollup_select) con filas recién insertadas
+    if isinstance(rows, list):
+        stmt = dialect_insert(ResultRollup).values(rows)
+    else:
+        stmt = dialect_insert(ResultRollup).from_select(ROLLUP_COLUMNS, rows)
+    new = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=UNIQUE_KEYS[ResultRollup],
+        set_={
+            "results": ResultRollup.results + new.results,
+            "total_seconds": ResultRollup.total_seconds + new.total_seconds,
+            "best_seconds": db.case((new.best_seconds < ResultRollup.best_seconds, new.best_seconds),
+                                    else_=ResultRollup.best_seconds),
+            "last_date": db.case((new.last_date > ResultRollup.last_date, new.last_date),
+                                 else_=ResultRollup.last_date),
+        },
+    )
+    db.session.execute(stmt)
 
-        for u in users:
-            has_result = (
-                Result.query.filter_by(user_id=u.id, date=yesterday, difficulty=diff).first()
-                is not None
-            )
-            if not has_result:
-                new_result = Result(
-                    user_id=u.id,
-                    difficulty=diff,
-                    date=yesterday,
-                    minutes=worst.minutes,
-                    seconds=worst.seconds,
-                )
-                u.current_streak = 0
-                db.session.add(new_result)
+def rebuild_rollup():
+    db.session.execute(db.delete(ResultRollup))
+    db.session.execute(db.insert(ResultRollup).from_select(ROLLUP_COLUMNS, rollup_select(db.true())))
+    bump_data_version()
     db.session.commit()
-    
 
-@app.before_request
-def load_user():
-    g.user = None
-    g.streak_active = False
-    g.streak_color = "var(--panel)"  # fallback
+def verify_rollup():
+    # diferencias entre el rollup mantenido y un recálculo completo
+    expected = {(r[0], r[1]): tuple(r[2:]) for r in db.session.execute(rollup_select(db.true()))}
+    actual = {
+        (r.user_id, r.difficulty): (r.results, r.total_seconds, r.best_seconds, r.last_date)
+        for r in ResultRollup.query
+    }
+    return {key: (actual.get(key), expected.get(key))
+            for key in expected.keys() | actual.keys() if actual.get(key) != expected.get(key)}
+
+@app.cli.command("rollup-rebuild")
+def rollup_rebuild_command():
+    rebuild_rollup()
+    print(f"Rollup reconstruido: {ResultRollup.query.count()} filas")
+
+@app.cli.command("rollup-verify")
+def rollup_verify_command():
+    diffs = verify_rollup()
+    for (user_id, diff), (actual, expected) in sorted(diffs.items()):
+        print(f"user {user_id} {diff}: rollup {actual} != recalculado {expected}")
+    print("✅ Rollup consistente" if not diffs else f"❌ {len(diffs)} diferencias")
+
+@app.cli.command("migrate-schema")
+def migrate_schema_command():
+    migrate_schema()
+    print("Esquema actualizado")
+
+# Caché
+# versión de los datos: submit() y el backfill la incrementan y así invalidan las vistas cacheadas
+def data_version():
+    if "data_version" not in g:
+        g.data_version = db.session.query(DataVersion.version).filter_by(name="results").scalar() or 0
+    return g.data_version
+
+def bump_data_version():
+    # en la misma transacción que los cambios: si hay rollback la versión tampoco cambia
+    stmt = dialect_insert(DataVersion).values(name="results", version=1)
+    stmt = stmt.on_conflict_do_update(index_elements=["name"], set_={"version": DataVersion.version + 1})
+    db.session.execute(stmt)
+    g.pop("data_version", None)
+
+class LRUCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+class SharedCache:
+    # backend compartido entre instancias: cualquier cliente con get/set tipo Redis
+    def __init__(self, client, ttl=24 * 3600, prefix="pips:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+def make_cache():
+    url = os.environ.get("CACHE_URL")
+    if url:
+        import redis  # opcional: solo si se configura CACHE_URL
+        return SharedCache(redis.Redis.from_url(url))
+    return LRUCache(int(os.environ.get("CACHE_SIZE", 256)))
+
+cache = make_cache()
+
+def cached(name, *parts, build):
+    key = ":".join(str(p) for p in (name, data_version(), *parts))
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value)
+    return value
+
+# Contraseñas
+# cada login cuesta un hash deliberadamente caro en el hilo del request (scrypt por defecto: ~30MB y
+# ~0.2s de CPU). Los parámetros se configuran con PASSWORD_HASH_METHOD (formato de werkzeug, ej.
+# "scrypt:16384:8:1" o "pbkdf2:sha256:600000") y los hashes viejos se rehacen al entrar.
+# Antes de tocar la base o el hash, cada intento pasa por una ventana deslizante por IP y por usuario,
+# así una ráfaga de intentos se corta sin ocupar los workers. Con LIMITER_URL (Redis) la cuenta se
+# comparte entre instancias.
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+LOGIN_WINDOW = int(os.environ.get("LOGIN_WINDOW", 300))
+# intentos por ventana (0 = sin límite); login y registro comparten el cupo por IP
+LOGIN_MAX_PER_IP = int(os.environ.get("LOGIN_MAX_PER_IP", 20))
+# por usuario desde cada IP: quien prueba contraseñas desde otra IP no bloquea al dueño de la cuenta
+LOGIN_MAX_PER_USER = int(os.environ.get("LOGIN_MAX_PER_USER", 5))
+# por usuario desde cualquier IP: tope alto contra un ataque repartido entre muchas IPs
+LOGIN_MAX_PER_USERNAME = int(os.environ.get("LOGIN_MAX_PER_USERNAME", 100))
+
+# detrás de un proxy (Vercel, nginx) la IP del cliente llega en X-Forwarded-For
+if env_flag("TRUST_PROXY", bool(os.environ.get("VERCEL"))):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+
+# {método configurado: método con todos sus parámetros tal como werkzeug lo escribe en el hash}
+_password_prefixes = {}
+
+def password_hash_prefix():
+    # "scrypt" -> "scrypt:32768:8:1"; se calcula una vez por proceso con un hash de prueba
+    if PASSWORD_HASH_METHOD not in _password_prefixes:
+        sample = generate_password_hash("", PASSWORD_HASH_METHOD)
+        _password_prefixes[PASSWORD_HASH_METHOD] = sample.split("$", 1)[0]
+    return _password_prefixes[PASSWORD_HASH_METHOD]
+
+class SlidingWindowLimiter:
+    # en memoria del proceso: {clave: instantes de los intentos dentro de la ventana}
+    def __init__(self, maxkeys=10000):
+        self.maxkeys = maxkeys
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def hit(self, key, limit, window):
+        # cuenta el intento y devuelve 0, o los segundos que faltan para que se libere un lugar
+        # (los intentos rechazados no se cuentan)
+        now = time.monotonic()
+        with self.lock:
+            hits = self.windows.get(key)
+            if hits is None:
+                if len(self.windows) >= self.maxkeys:
+                    self.prune(now - window)
+                hits = self.windows[key] = deque()
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return hits[0] + window - now
+            hits.append(now)
+            return 0
+
+    def reset(self, key):
+        with self.lock:
+            self.windows.pop(key, None)
+
+    def prune(self, cutoff):
+        for key in [k for k, hits in self.windows.items() if not hits or hits[-1] <= cutoff]:
+            del self.windows[key]
+        # muchas claves vivas (ej. un ataque desde muchas IPs): se olvidan las más viejas
+        while len(self.windows) >= self.maxkeys:
+            del self.windows[next(iter(self.windows))]
+
+class SharedLimiter:
+    # backend compartido entre instancias: un sorted set por clave (cualquier cliente con pipeline tipo Redis)
+    def __init__(self, client, prefix="pips:limit:"):
+        self.client = client
+        self.prefix = prefix
+
+    def hit(self, key, limit, window):
+        now = time.time()
+        name = self.prefix + key
+        member = f"{now}:{os.urandom(4).hex()}"
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(name, 0, now - window)
+        pipe.zadd(name, {member: now})
+        pipe.zcard(name)
+        pipe.zrange(name, 0, 0, withscores=True)
+        pipe.expire(name, int(window) + 1)
+        _, _, count, oldest, _ = pipe.execute()
+        if count <= limit:
+            return 0
+        self.client.zrem(name, member)
+        return max(oldest[0][1] + window - now, 1)
+
+    def reset(self, key):
+        self.client.delete(self.prefix + key)
+
+def make_limiter():
+    url = os.environ.get("LIMITER_URL")
+    if url:
+        import redis  # opcional: solo si se configura LIMITER_URL
+        return SharedLimiter(redis.Redis.from_url(url))
+    return SlidingWindowLimiter(int(os.environ.get("LIMITER_KEYS", 10000)))
+
+login_limiter = make_limiter()
+
+def user_key(username, ip=None):
+    key = f"user:{username[:80].lower()}"
+    return f"{key}:{ip}" if ip else key
+
+def throttled(username=None):
+    # segundos a esperar antes de otro intento, o 0 si el intento sigue (y queda contado)
+    checks = [(f"ip:{request.remote_addr}", LOGIN_MAX_PER_IP)]
+    if username is not None:
+        checks.append((user_key(username, request.remote_addr), LOGIN_MAX_PER_USER))
+        checks.append((user_key(username), LOGIN_MAX_PER_USERNAME))
+    for key, limit in checks:
+        wait = limit and login_limiter.hit(key, limit, LOGIN_WINDOW)
+        if wait:
+            return wait
+    return 0
+
+def too_many_attempts(template, wait):
+    minutes = max(1, round(wait / 60))
+    flash(f"Demasiados intentos. Prueba de nuevo en {minutes} min.", "error")
+    return render_template(template), 429, {"Retry-After": str(math.ceil(wait))}
+
+# Analítica
+# mejor tiempo, mediana, p90 y posición diaria por usuario y dificultad. En Postgres sale de una
+# consulta con funciones de ventana y percentile_cont; SQLite (desarrollo) no tiene agregados de
+# percentil y sus ventanas son lentas, así que ahí se calcula en Python con los mismos resultados.
+ANALYTICS_PERCENTILES = {"median": 0.5, "p90": 0.9}
+
+def played_days(user_ids, exclude_backfilled):
+    # (día, dificultad) que jugó alguno de los usuarios: los demás no cambian sus posiciones. Con
+    # exclude_backfilled los días rellenados tampoco, así no se leen los resultados de todos esos días
+    query = db.select(Result.date, Result.difficulty).where(Result.user_id.in_(user_ids))
+    if exclude_backfilled:
+        query = query.where(Result.backfilled.is_(False))
+    return db.tuple_(Result.date, Result.difficulty).in_(query.distinct())
+
+def sql_analytics(user_ids, exclude_backfilled, ranks):
+    total = Result.minutes * 60 + Result.seconds
+    filters = [Result.backfilled.is_(False)] if exclude_backfilled else []
+    if ranks:
+        day = (Result.date, Result.difficulty)
+        ranked = db.select(
+            Result.user_id, Result.difficulty, Result.date, total.label("total"),
+            db.func.rank().over(partition_by=day, order_by=total).label("rank"),
+            db.func.percent_rank().over(partition_by=day, order_by=total).label("pct"),
+            db.func.count().over(partition_by=day).label("players"),
+        ).where(played_days(user_ids, exclude_backfilled), *filters).subquery()
+        # posiciones ya calculadas sobre todos los jugadores; recency 1 = último día del usuario
+        source = db.select(
+            ranked,
+            db.func.row_number().over(partition_by=(ranked.c.user_id, ranked.c.difficulty),
+                                      order_by=ranked.c.date.desc()).label("recency"),
+        ).where(ranked.c.user_id.in_(user_ids)).subquery()
+    else:
+        source = db.select(Result.user_id, Result.difficulty, total.label("total")) \
+            .where(Result.user_id.in_(user_ids), *filters).subquery()
+
+    columns = [
+        source.c.user_id, source.c.difficulty, db.func.count(), db.func.min(source.c.total),
+        *[db.func.percentile_cont(q).within_group(source.c.total) for q in ANALYTICS_PERCENTILES.values()],
+    ]
+    if ranks:
+        def latest(column):
+            return db.func.max(db.case((source.c.recency == 1, column)))
+        columns += [db.func.avg(1 - source.c.pct), latest(source.c.rank),
+                    latest(source.c.players), latest(source.c.date)]
+    rows = db.session.query(*columns).group_by(source.c.user_id, source.c.difficulty)
+    return {(user_id, diff): values for user_id, diff, *values in rows}
+
+def percentile_cont(ordered, q):
+    # misma interpolación lineal que percentile_cont de Postgres
+    position = q * (len(ordered) - 1)
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+def python_analytics(user_ids, exclude_backfilled, ranks):
+    # mismo resultado que sql_analytics, con una sola consulta de filas
+    wanted = set(user_ids)
+    query = db.session.query(Result.user_id, Result.difficulty, Result.date, Result.minutes * 60 + Result.seconds)
+    if exclude_backfilled:
+        query = query.filter(Result.backfilled.is_(False))
+    query = query.filter(played_days(user_ids, exclude_backfilled) if ranks else Result.user_id.in_(user_ids))
+
+    by_day, mine = defaultdict(list), defaultdict(list)
+    for user_id, diff, d, total in query:
+        by_day[(d, diff)].append(total)
+        if user_id in wanted:
+            mine[(user_id, diff)].append((d, total))
+    for totals in by_day.values():
+        totals.sort()
+
+    def position(d, diff, total):
+        # (rank, percent_rank, jugadores) como las funciones de ventana
+        others = by_day[(d, diff)]
+        rank = bisect_left(others, total) + 1
+        return rank, (rank - 1) / (len(others) - 1) if len(others) > 1 else 0, len(others)
+
+    analytics = {}
+    for (user_id, diff), played in mine.items():
+        totals = sorted(total for _, total in played)
+        values = [len(totals), totals[0], *[percentile_cont(totals, q) for q in ANALYTICS_PERCENTILES.values()]]
+        if ranks:
+            pcts = [position(d, diff, total)[1] for d, total in played]
+            last_day, last_total = max(played)
+            rank, _, players = position(last_day, diff, last_total)
+            values += [1 - sum(pcts) / len(pcts), rank, players, last_day]
+        analytics[(user_id, diff)] = values
+    return analytics
+
+def user_analytics(user_ids, exclude_backfilled=True, ranks=True):
+    # {user_id: {dificultad: {...}}} con una consulta sin importar cuántos usuarios; percentile es el
+    # % promedio de jugadores superados por día (100 = siempre primero). ranks=False evita recorrer
+    # los días completos (el leaderboard solo necesita medianas)
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    compute = sql_analytics if db.session.get_bind().dialect.name == "postgresql" else python_analytics
+
+    analytics = defaultdict(dict)
+    for (user_id, diff), (count, best, *values) in compute(user_ids, exclude_backfilled, ranks).items():
+        percentiles, values = values[:len(ANALYTICS_PERCENTILES)], values[len(ANALYTICS_PERCENTILES):]
+        entry = {"results": count, "best": best,
+                 **{name: float(v) for name, v in zip(ANALYTICS_PERCENTILES, percentiles)}}
+        if ranks:
+            beaten, rank, players, rank_date = values
+            entry.update(percentile=round(float(beaten) * 100, 1), rank=rank, players=players,
+                         rank_date=rank_date.isoformat())
+        analytics[user_id][diff] = entry
+    return dict(analytics)
+
+# Leaderboard
+# {clave de orden: menor es mejor}
+LEADERBOARD_SORT_KEYS = {
+    "username": True,
+    "streak": False,
+    "avg_easy": True,
+    "avg_medium": True,
+    "avg_hard": True,
+    "stamps": False,
+}
+LEADERBOARD_PER_PAGE = 50
+
+def leaderboard_query():
+    # cantidad de estampillas por usuario (una sola agregación)
+    stamp_counts = (
+        db.session.query(UserStamp.user_id, db.func.count(UserStamp.id).label("stamps"))
+        .group_by(UserStamp.user_id)
+        .subquery()
+    )
 
-    if "user_id" in session:
-        user = User.query.get(session["user_id"])
-        g.user = user
+    # promedios por dificultad desde el rollup (una fila por usuario y dificultad)
+    average = db.cast(ResultRollup.total_seconds, db.Float) / ResultRollup.results
+    averages = (
+        db.session.query(
+            ResultRollup.user_id,
+            *[
+                db.func.max(db.case((ResultRollup.difficulty == diff, average))).label(f"avg_{diff.lower()}")
+                for diff in DIFFICULTIES
+            ],
+        )
+        .group_by(ResultRollup.user_id)
+        .subquery()
+    )
+
+    return (
+        db.session.query(
+            User.id.label("user_id"),
+            User.username.label("username"),
+            User.current_streak.label("streak"),
+            db.func.coalesce(stamp_counts.c.stamps, 0).label("stamps"),
+            averages.c.avg_easy,
+            averages.c.avg_medium,
+            averages.c.avg_hard,
+        )
+        .outerjoin(stamp_counts, stamp_counts.c.user_id == User.id)
+        .outerjoin(averages, averages.c.user_id == User.id)
+        .filter(User.username != "admin")
+    )
 
-        # calcular si jugó HOY (Europe/Paris)
-        local_tz = pytz.timezone("Europe/Paris")
-        today = datetime.now(local_tz).date()
+def build_leaderboard(sort="streak", page=1, per_page=LEADERBOARD_PER_PAGE):
+    if sort not in LEADERBOARD_SORT_KEYS:
+        sort = "streak"
+    page = max(page, 1)
+
+    board = leaderboard_query().subquery()
+    total = db.session.query(db.func.count()).select_from(board).scalar()
+
+    # tiempos: menor es mejor y los usuarios sin datos al final; racha y stamps: mayor es mejor
+    column = board.c[sort]
+    order = column.asc() if LEADERBOARD_SORT_KEYS[sort] else column.desc()
+    rows = (
+        db.session.query(board)
+        .order_by(order.nulls_last(), board.c.username.asc())
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+        .all()
+    )
 
-        # Si last_played está definido y es igual a hoy => activo
-        try:
-            g.streak_active = (user.last_played == today)
-        except Exception:
-            # si por alguna razón last_played es None o mal, lo consideramos inactivo
-            g.streak_active = False
-
-        # Elegir color según la racha (puedes ajustar colores)
-        s = (user.current_streak or 0)
-        if not g.streak_active:
-            # gris cuando no jugó hoy
-            g.streak_color = "#3b3b3b"
+    pages = max((total + per_page - 1) // per_page, 1)
+    return {"data": leaderboard_rows(rows), "sort": sort, "page": page, "pages": pages,
+            "offset": (page - 1) * per_page}
+
+def leaderboard_rows(rows):
+    # medianas sin los resultados del backfill, para todas las filas de una vez
+    analytics = user_analytics((r.user_id for r in rows), ranks=False)
+
+    data = []
+    for r in rows:
+        data.append({
+            "username": r.username,
+            "streak": r.streak,
+            "stamps": r.stamps,
+            "avg_easy": float(r.avg_easy) if r.avg_easy else None,
+            "avg_medium": float(r.avg_medium) if r.avg_medium else None,
+            "avg_hard": float(r.avg_hard) if r.avg_hard else None,
+            **{
+                f"median_{diff.lower()}": analytics.get(r.user_id, {}).get(diff, {}).get("median")
+                for diff in DIFFICULTIES
+            },
+        })
+    return data
+
+# Estadísticas
+def historical_averages(user_id=None):
+    # {dificultad: promedio en segundos} desde el rollup, sin recorrer Result
+    query = db.session.query(
+        ResultRollup.difficulty,
+        db.func.sum(ResultRollup.total_seconds),
+        db.func.sum(ResultRollup.results),
+    ).group_by(ResultRollup.difficulty)
+    if user_id is not None:
+        query = query.filter(ResultRollup.user_id == user_id)
+    return {diff: total / count for diff, total, count in query if count}
+
+# presupuesto de puntos por serie en los gráficos (0 = sin límite)
+STATS_POINT_BUDGET = int(os.environ.get("STATS_POINT_BUDGET", 180))
+# ventana máxima de ?days=: más que toda la historia, y lejos de desbordar date
+STATS_MAX_DAYS = 36500
+
+def lttb(points, threshold):
+    # Largest-Triangle-Three-Buckets: elige `threshold` puntos que conservan la forma de la serie
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # promedio del bucket siguiente
+        start, end = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, n)
+        avg_x = sum(p[0] for p in points[start:end]) / (end - start)
+        avg_y = sum(p[1] for p in points[start:end]) / (end - start)
+
+        # el punto del bucket actual que forma el triángulo más grande
+        ax, ay = points[a]
+        best, best_area = None, -1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+def downsample(points, budget):
+    # LTTB con los extremos globales garantizados; nunca más de `budget` puntos
+    if len(points) <= budget:
+        return points
+    # LTTB necesita al menos 3 puntos (si no, devuelve la serie entera) y los extremos ocupan 2 más
+    budget = max(budget, 5)
+    kept = set(lttb(points, budget - 2))
+    kept.add(min(points, key=lambda p: p[1]))
+    kept.add(max(points, key=lambda p: p[1]))
+    return sorted(kept)
+
+def downsample_payload(payload, budget):
+    # payload de una dificultad: {dates, labels, datasets} con datos alineados a las fechas
+    n = len(payload["dates"])
+    if not budget or n <= budget:
+        return payload
+
+    kept = {0, n - 1}
+    series = []
+    for ds in payload["datasets"]:
+        if ds.get("average"):
+            series.append((ds, None))
+            continue
+        points = downsample([(i, v) for i, v in enumerate(ds["data"]) if v is not None], budget)
+        kept.update(i for i, _ in points)
+        series.append((ds, points))
+
+    # solo quedan las fechas que alguna serie usa; los puntos pasan a ser {x: índice, y: valor}
+    order = sorted(kept)
+    position = {i: j for j, i in enumerate(order)}
+    datasets = []
+    for ds, points in series:
+        if points is None:
+            # el promedio sigue siendo exacto: una recta de dos puntos
+            avg = ds["value"]
+            data = [{"x": 0, "y": avg}, {"x": len(order) - 1, "y": avg}]
         else:
-            # Paleta por rangos
-            if s >= 50:
-                g.streak_color = "#ef4444"  # rojo extremo
-            elif s >= 30:
-                g.streak_color = "#3b82f6"  # violeta
-            elif s >= 10:
-                g.streak_color = "#ffcc3e"  # amarillo
-            elif s >= 5:
-                g.streak_color = "#22c55e"  # verde
-            else:
-                g.streak_color = "#aaf7ff"  # neutro oscuro para rachas pequeñas
-
-
-
-@app.before_request
-def auto_update():
-    global last_update_date
+            data = [{"x": position[i], "y": v} for i, v in points]
+        datasets.append(dict(ds, data=data))
+
+    return {
+        "dates": [payload["dates"][i] for i in order],
+        "labels": [payload["labels"][i] for i in order],
+        "datasets": datasets,
+        "downsampled": True,
+    }
+
+def average_line(avg, length):
+    return {
+        "label": "Promedio histórico",
+        "data": [avg] * length,
+        "borderDash": [5, 5],  # línea punteada
+        "borderColor": "rgba(255, 255, 255, 0.8)",
+        "backgroundColor": "transparent",
+        "tension": 0,
+        "pointRadius": 0,
+        "average": True,  # el cliente la reemplaza entera al recibir un delta
+        "value": avg,  # ...con este valor: un delta sin fechas trae la línea vacía
+    }
+
+def build_stats(days=None, since=None, points=None):
+    # since: solo los puntos desde esa fecha (inclusive), para que el cliente agregue el delta
+    total_seconds = Result.minutes * 60 + Result.seconds
+    query = (
+        db.session.query(User.username, Result.difficulty, Result.date, total_seconds.label("total"))
+        .join(User, User.id == Result.user_id)
+    )
+    if days:
+        today = datetime.now(pytz.timezone("Europe/Paris")).date()
+        query = query.filter(Result.date > today - timedelta(days=days))
+    if since:
+        query = query.filter(Result.date >= since)
+
+    # una sola pasada: {dificultad: {(usuario, fecha): segundos}}
+    index = {diff: {} for diff in DIFFICULTIES}
+    for username, diff, d, total in query:
+        if diff in index:
+            index[diff][(username, d)] = total
+
+    # el promedio histórico es sobre toda la historia aunque haya ventana
+    averages = historical_averages()
+
+    data_by_diff = {}
+    for diff in DIFFICULTIES:
+        values = index[diff]
+        dates = sorted({d for _, d in values})
+        users = sorted({u for u, _ in values})
+        labels = [d.strftime("%d/%m") for d in dates]
+
+        datasets = []
+        if averages.get(diff) is not None:
+            datasets.append(average_line(float(averages[diff]), len(dates)))
+
+        for u in users:
+            if u == "admin":
+                continue
+            datasets.append({"label": u, "data": [values.get((u, d)) for d in dates]})
+
+        payload = {"dates": [d.isoformat() for d in dates], "labels": labels, "datasets": datasets}
+        data_by_diff[diff] = downsample_payload(payload, points)
+
+    return data_by_diff
+
+def build_personal_stats(user_id, days=None, since=None, points=None):
+    query = (
+        db.session.query(Result.difficulty, Result.date, Result.minutes * 60 + Result.seconds)
+        .filter(Result.user_id == user_id)
+        .order_by(Result.date.asc())
+    )
+    if days:
+        today = datetime.now(pytz.timezone("Europe/Paris")).date()
+        query = query.filter(Result.date > today - timedelta(days=days))
+    if since:
+        query = query.filter(Result.date >= since)
+    rows = query.all()
+
+    averages = historical_averages(user_id)
+
+    data_by_diff = {}
+    for diff in DIFFICULTIES:
+        diff_results = [(d, total) for rdiff, d, total in rows if rdiff == diff]
+        labels = [d.strftime("%d/%m") for d, _ in diff_results]
+        values = [total for _, total in diff_results]
+
+        datasets = []
+        if values:
+            datasets.append(average_line(averages.get(diff), len(values)))
+            datasets.append({"label": "Tus tiempos", "data": values})
+
+        payload = {"dates": [d.isoformat() for d, _ in diff_results], "labels": labels, "datasets": datasets}
+        data_by_diff[diff] = downsample_payload(payload, points)
+
+    return data_by_diff
+
+# Estampillas
+# catálogo en memoria del proceso: {nombre: {id, name, image, description, category}}. Solo se
+# invalida por TTL: seed_stamps.py corre en otro proceso, y una estampilla nueva necesita además su
+# regla en STAMP_RULES, o sea un deploy que ya arranca con el catálogo vacío
+STAMP_CATALOG_TTL = int(os.environ.get("STAMP_CATALOG_TTL", 300))
+_stamp_catalog = {"stamps": None, "loaded_at": 0.0}
+
+def stamp_catalog():
+    if _stamp_catalog["stamps"] is None or time.monotonic() - _stamp_catalog["loaded_at"] > STAMP_CATALOG_TTL:
+        stamps = Stamp.query.order_by(Stamp.category, Stamp.id).all()
+        _stamp_catalog["stamps"] = {
+            s.name: {"id": s.id, "name": s.name, "image": s.image,
+                     "description": s.description, "category": s.category}
+            for s in stamps
+        }
+        _stamp_catalog["loaded_at"] = time.monotonic()
+    return _stamp_catalog["stamps"]
+
+def invalidate_stamp_catalog():
+    _stamp_catalog["stamps"] = None
+
+class StampSnapshot:
+    # lo que necesitan las reglas: resultados recientes, racha y estampillas ya ganadas
+    def __init__(self, user_id, now, streak, results, owned):
+        self.user_id = user_id
+        self.now = now
+        self.today = now.date()
+        self.streak = streak
+        self.results = results  # {(fecha, dificultad): segundos}
+        self.owned = owned  # {stamp_id}
+
+    def time(self, diff, days_ago=0):
+        return self.results.get((self.today - timedelta(days=days_ago), diff))
+
+# Reglas: cada una es un predicado sobre el snapshot
+def under(diff, limit, days=1):
+    # `diff` resuelto en menos de `limit` segundos, `days` días seguidos hasta hoy
+    def rule(snap):
+        times = [snap.time(diff, i) for i in range(days)]
+        return all(t is not None and t < limit for t in times)
+    return rule
+
+def all_of(*rules):
+    return lambda snap: all(rule(snap) for rule in rules)
+
+def streak_at_least(days):
+    return lambda snap: snap.streak >= days
+
+def early_bird(minutes):
+    # todas las dificultades de hoy completadas en los primeros `minutes` minutos del día
+    def rule(snap):
+        played_all = all(snap.time(diff) is not None for diff in DIFFICULTIES)
+        return played_all and snap.now.hour == 0 and snap.now.minute < minutes
+    return rule
+
+STAMP_RULES = {
+    "Racha corta": streak_at_least(5),
+    "Racha media": streak_at_least(10),
+    "Racha larga": streak_at_least(30),
+    "Racha extrema": streak_at_least(50),
+    "Manos ágiles": under("Easy", 15),
+    "Manos rápidas": under("Medium", 45),
+    "Manos turbo": under("Hard", 60),
+    "Speedrun": all_of(*[under(diff, 50) for diff in DIFFICULTIES]),
+    "Prime": under("Hard", 60, days=5),
+    "Precoz": early_bird(5),
+}
+# días de historia que necesita la regla más larga
+STAMP_HISTORY_DAYS = 5
+
+def load_stamp_snapshot(user_id, now, streak):
+    # resultados de la ventana y estampillas ganadas en una sola consulta;
+    # devuelve también qué dificultades ya tienen fila hoy (incluidas las del backfill)
+    since = now.date() - timedelta(days=STAMP_HISTORY_DAYS - 1)
+    results_q = db.select(
+        db.literal("result").label("kind"), Result.date, Result.difficulty,
+        (Result.minutes * 60 + Result.seconds).label("value"), Result.backfilled,
+    ).where(Result.user_id == user_id, Result.date >= since)
+    stamps_q = db.select(
+        db.literal("stamp"), db.cast(db.null(), db.Date), db.cast(db.null(), db.String),
+        UserStamp.stamp_id, db.false(),
+    ).where(UserStamp.user_id == user_id)
+
+    results, owned, played_today = {}, set(), set()
+    for kind, day, diff, value, backfilled in db.session.execute(db.union_all(results_q, stamps_q)):
+        if kind == "stamp":
+            owned.add(value)
+            continue
+        if day == now.date():
+            played_today.add(diff)
+        if not backfilled:
+            results[(day, diff)] = value
+    return StampSnapshot(user_id, now, streak, results, owned), played_today
+
+def earned_stamps(snapshot, rules=None):
+    # estampillas del catálogo que el snapshot gana y todavía no tiene
+    catalog = stamp_catalog()
+    return [
+        catalog[name] for name, rule in (rules or STAMP_RULES).items()
+        if name in catalog and catalog[name]["id"] not in snapshot.owned and rule(snapshot)
+    ]
+
+def award_stamps(snapshot):
+    # evalúa todas las reglas y guarda las estampillas nuevas en un solo INSERT
+    won = earned_stamps(snapshot)
+    if not won:
+        return []
+    inserted = set(insert_ignore(
+        UserStamp, [{"user_id": snapshot.user_id, "stamp_id": stamp["id"]} for stamp in won],
+        returning=UserStamp.stamp_id,
+    ))
+    return [stamp for stamp in won if stamp["id"] in inserted]
+
+def fill_missing_results(day=None):
+    # rellena el día anterior con el peor tiempo para quien no jugó, y los días que quedaron sin
+    # rellenar desde la última corrida (un cron que no corrió); devuelve cuántas filas insertó
     local_tz = pytz.timezone("Europe/Paris")
-    today = datetime.now(local_tz).date()
+    if day is None:
+        day = datetime.now(local_tz).date() - timedelta(days=1)
 
-    if last_update_date != today:
-        fill_missing_results()
-        last_update_date = today
+    # marcador en la base bajo lock: si otra instancia ya rellenó ese día, no hacemos nada
+    marker = JobMarker.query.filter_by(name="backfill").with_for_update().first()
+    if marker is None:
+        try:
+            db.session.add(JobMarker(name="backfill"))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # otra instancia lo creó al mismo tiempo
+        marker = JobMarker.query.filter_by(name="backfill").with_for_update().first()
+    if marker.last_date is not None and marker.last_date >= day:
+        db.session.rollback()
+        return 0
+
+    first = day if marker.last_date is None else marker.last_date + timedelta(days=1)
+    inserted = 0
+    for offset in range((day - first).days + 1):
+        inserted += backfill_day(first + timedelta(days=offset))
+
+    marker.last_date = day
+    bump_data_version()
+    db.session.commit()
+    return inserted
+
+def backfill_day(day):
+    # un día, dentro de la transacción (y el lock) de fill_missing_results
+    # peor resultado del día (mayor tiempo total) por dificultad
+    total_seconds = Result.minutes * 60 + Result.seconds
+    worst = (
+        db.session.query(Result.difficulty.label("difficulty"), db.func.max(total_seconds).label("total"))
+        .filter(Result.date == day, Result.difficulty.in_(DIFFICULTIES))
+        .group_by(Result.difficulty)
+        .subquery()
+    )
+
+    # pares (usuario, dificultad) sin resultado ese día
+    played = (
+        db.select(Result.id)
+        .where(Result.user_id == User.id, Result.date == day, Result.difficulty == worst.c.difficulty)
+        .correlate_except(Result)
+        .exists()
+    )
+    # quien no jugó alguna dificultad pierde la racha, salvo que ya haya completado un día posterior
+    # (el cron corre pasada la medianoche de Paris: submit() ya le dejó la racha en 1)
+    db.session.execute(
+        db.update(User)
+        .where(User.last_played <= day, db.select(worst.c.difficulty).where(~played).exists())
+        .values(current_streak=0)
+    )
+
+    inserted = db.session.execute(
+        dialect_insert(Result).from_select(
+            ["user_id", "difficulty", "date", "minutes", "seconds", "backfilled"],
+            db.select(
+                User.id,
+                worst.c.difficulty,
+                db.literal(day, db.Date),
+                worst.c.total // 60,
+                worst.c.total % 60,
+                db.true(),
+            )
+            .select_from(User)
+            .join(worst, db.true())
+            .where(~played),
+        ).on_conflict_do_nothing(index_elements=UNIQUE_KEYS[Result])
+    ).rowcount
+
+    if inserted:
+        add_to_rollup(rollup_select(Result.date == day, Result.backfilled.is_(True)))
+    snapshot_standings(day)
+    return inserted
+
+@app.cli.command("backfill")
+def backfill_command():
+    inserted = fill_missing_results()
+    print(f"Resultados rellenados: {inserted}")
+
+# Recalcular historia
+# reglas que no se pueden deducir de la tabla Result (dependen de la hora de envío)
+NON_RETROACTIVE_STAMPS = {"Precoz"}
+
+class HistoryState:
+    # estado de un usuario mientras se recorre su historia en orden de fecha
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.streak = 0
+        self.last_played = None
+        self.window = {}  # {(fecha, dificultad): segundos} de los últimos STAMP_HISTORY_DAYS días
+        self.earned = set()
+
+    def close_day(self, day, rows, rules):
+        # rows: {dificultad: (segundos, backfilled)}
+        if any(backfilled for _, backfilled in rows.values()):
+            self.streak = 0  # el backfill de ese día reseteó la racha
+        elif all(diff in rows for diff in DIFFICULTIES):
+            self.streak = self.streak + 1 if self.last_played == day - timedelta(days=1) else 1
+            self.last_played = day
+
+        for diff, (total, backfilled) in rows.items():
+            if not backfilled:
+                self.window[(day, diff)] = total
+        oldest = day - timedelta(days=STAMP_HISTORY_DAYS - 1)
+        self.window = {k: v for k, v in self.window.items() if k[0] >= oldest}
+
+        # mediodía: ninguna regla dependiente de la hora aplica
+        noon = pytz.timezone("Europe/Paris").localize(datetime(day.year, day.month, day.day, 12))
+        snapshot = StampSnapshot(self.user_id, noon, self.streak, self.window, self.earned)
+        self.earned |= {stamp["id"] for stamp in earned_stamps(snapshot, rules)}
+
+def recompute_history(dry_run=False, prune=False, batch_size=5000):
+    # recorre Result ordenado por (usuario, fecha) una sola vez y recalcula rachas y estampillas
+    started = time.perf_counter()
+    catalog = stamp_catalog()
+    rules = {name: rule for name, rule in STAMP_RULES.items() if name not in NON_RETROACTIVE_STAMPS}
+    prunable = {catalog[name]["id"] for name in rules if name in catalog}
+
+    users = {uid: (streak, last) for uid, streak, last in
+             db.session.query(User.id, User.current_streak, User.last_played)}
+    owned = {}
+    for uid, stamp_id in db.session.query(UserStamp.user_id, UserStamp.stamp_id):
+        owned.setdefault(uid, set()).add(stamp_id)
+
+    report = {"rows": 0, "users": 0, "streaks": [], "added": [], "removed": []}
+
+    def finish(state):
+        report["users"] += 1
+        streak, last_played = users.get(state.user_id, (None, None))
+        new_last = state.last_played or last_played
+        if (streak, last_played) != (state.streak, new_last):
+            report["streaks"].append({"id": state.user_id, "current_streak": state.streak, "last_played": new_last})
+        have = owned.get(state.user_id, set())
+        report["added"] += [(state.user_id, sid) for sid in state.earned - have]
+        if prune:
+            report["removed"] += [(state.user_id, sid) for sid in (have & prunable) - state.earned]
+
+    rows = (
+        db.session.query(Result.user_id, Result.date, Result.difficulty,
+                         Result.minutes * 60 + Result.seconds, Result.backfilled)
+        .order_by(Result.user_id, Result.date)
+        .execution_options(yield_per=batch_size)
+    )
+    state, day, day_rows = None, None, {}
+    for user_id, d, diff, total, backfilled in rows:
+        report["rows"] += 1
+        if state is None or user_id != state.user_id:
+            if state is not None:
+                state.close_day(day, day_rows, rules)
+                finish(state)
+            state, day, day_rows = HistoryState(user_id), d, {}
+        elif d != day:
+            state.close_day(day, day_rows, rules)
+            day, day_rows = d, {}
+        day_rows[diff] = (total, backfilled)
+    if state is not None:
+        state.close_day(day, day_rows, rules)
+        finish(state)
+
+    if not dry_run:
+        bump_data_version()
+        for i in range(0, len(report["streaks"]), batch_size):
+            db.session.execute(db.update(User), report["streaks"][i:i + batch_size])
+        for i in range(0, len(report["added"]), batch_size):
+            batch = report["added"][i:i + batch_size]
+            insert_ignore(UserStamp, [{"user_id": uid, "stamp_id": sid} for uid, sid in batch])
+        for i in range(0, len(report["removed"]), batch_size):
+            batch = report["removed"][i:i + batch_size]
+            db.session.execute(db.delete(UserStamp).where(db.tuple_(UserStamp.user_id, UserStamp.stamp_id).in_(batch)))
+        db.session.commit()
+
+    report["seconds"] = time.perf_counter() - started
+    return report
+
+def legacy_backfill_cutoff():
+    # último día con resultados anteriores a la columna backfilled (None si la base nació con ella):
+    # hasta ahí los días rellenados por el backfill cuentan como jugados y alargan las rachas
+    return db.session.query(JobMarker.last_date).filter_by(name="legacy_backfill").scalar()
+
+def refuse_legacy_history(trust_legacy):
+    cutoff = legacy_backfill_cutoff()
+    if cutoff and not trust_legacy:
+        print(f"❌ hay resultados hasta {cutoff} de antes de la columna backfilled: los días rellenados "
+              "cuentan como jugados y las rachas (y sus estampillas) saldrían infladas.")
+        print("Revisar con --dry-run, o escribir igual con --trust-legacy.")
+        raise SystemExit(1)
+
+@app.cli.command("recompute")
+@click.option("--dry-run", is_flag=True, help="Solo mostrar los cambios, sin escribir.")
+@click.option("--prune", is_flag=True, help="Quitar estampillas que la historia no justifica.")
+@click.option("--trust-legacy", is_flag=True, help="Escribir aunque haya resultados de antes de la columna backfilled.")
+@click.option("--batch-size", default=5000, show_default=True)
+def recompute_command(dry_run, prune, trust_legacy, batch_size):
+    if not dry_run:
+        refuse_legacy_history(trust_legacy)
+    report = recompute_history(dry_run=dry_run, prune=prune, batch_size=batch_size)
+    rate = report["rows"] / report["seconds"] if report["seconds"] else 0
+    print(f"{report['rows']} resultados de {report['users']} usuarios en {report['seconds']:.2f}s ({rate:,.0f} filas/s)")
+    print(f"rachas a corregir: {len(report['streaks'])}")
+    for change in report["streaks"]:
+        print(f"  user {change['id']}: racha {change['current_streak']}, último día {change['last_played']}")
+    print(f"estampillas a agregar: {len(report['added'])}, a quitar: {len(report['removed'])}")
+    if dry_run:
+        cutoff = legacy_backfill_cutoff()
+        if cutoff:
+            print(f"(hasta {cutoff} los días rellenados por el backfill cuentan como jugados)")
+        print("(dry run: no se escribió nada)")
+
+# Posiciones diarias
+# rangos del leaderboard histórico: días cerrados hacia atrás desde el último snapshot (None = todo)
+STANDINGS_RANGES = {"week": 7, "month": 30, "all": None}
+# {clave de orden: menor es mejor}
+STANDINGS_SORT_KEYS = {
+    "username": True,
+    "wins": False,
+    "avg_rank": True,
+    "days": False,
+    "avg_easy": True,
+    "avg_medium": True,
+    "avg_hard": True,
+    "streak": False,
+    "stamps": False,
+}
+STANDINGS_COLUMNS = ["date", "difficulty", "user_id", "seconds", "rank", "backfilled", "streak", "stamps"]
+
+def standings_select(*filters):
+    # una fila por resultado con su puesto del día; racha y estampillas son las actuales del usuario,
+    # así que sirve para el día que se acaba de cerrar (si ya completó el día siguiente, va una menos,
+    # nunca por debajo de 0: la foto no se reescribe)
+    total = Result.minutes * 60 + Result.seconds
+    stamp_counts = (
+        db.select(UserStamp.user_id, db.func.count().label("stamps"))
+        .group_by(UserStamp.user_id)
+        .subquery()
+    )
+    return (
+        db.select(
+            Result.date, Result.difficulty, Result.user_id, total,
+            db.func.rank().over(partition_by=(Result.date, Result.difficulty), order_by=total),
+            Result.backfilled,
+            db.case(
+                (User.last_played <= Result.date, User.current_streak),
+                (User.current_streak > 0, User.current_streak - 1),
+                else_=0,
+            ),
+            db.func.coalesce(stamp_counts.c.stamps, 0),
+        )
+        .join(User, User.id == Result.user_id)
+        .outerjoin(stamp_counts, stamp_counts.c.user_id == Result.user_id)
+        .where(Result.difficulty.in_(DIFFICULTIES), *filters)
+    )
+
+def snapshot_standings(day):
+    # append-only: si el día ya tiene foto no se toca (para rehacerla, rebuild_standings)
+    return db.session.execute(
+        dialect_insert(DailyStanding)
+        .from_select(STANDINGS_COLUMNS, standings_select(Result.date == day))
+        .on_conflict_do_nothing(index_elements=UNIQUE_KEYS[DailyStanding])
+    ).rowcount
+
+def rebuild_standings(start=None, end=None, batch_size=5000):
+    # rehace las fotos de [start, end] desde Result: tiempos y puestos con una consulta, y racha y
+    # estampillas de cada día recorriendo la historia como recompute (solo reglas retroactivas)
+    filters = []
+    if start:
+        filters.append(Result.date >= start)
+    if end:
+        filters.append(Result.date <= end)
+    delete = db.delete(DailyStanding)
+    if start:
+        delete = delete.where(DailyStanding.date >= start)
+    if end:
+        delete = delete.where(DailyStanding.date <= end)
+    db.session.execute(delete)
+    written = db.session.execute(
+        db.insert(DailyStanding).from_select(STANDINGS_COLUMNS, standings_select(*filters))
+    ).rowcount
+
+    rules = {name: rule for name, rule in STAMP_RULES.items() if name not in NON_RETROACTIVE_STAMPS}
+    table = DailyStanding.__table__
+    update = (
+        table.update()
+        .where(table.c.user_id == db.bindparam("u"), table.c.date == db.bindparam("d"))
+        .values(streak=db.bindparam("new_streak"), stamps=db.bindparam("new_stamps"))
+    )
+    pending = []
+
+    def close(state, day, day_rows):
+        state.close_day(day, day_rows, rules)
+        if (not start or day >= start) and (not end or day <= end):
+            pending.append({"u": state.user_id, "d": day, "new_streak": state.streak, "new_stamps": len(state.earned)})
+        if len(pending) >= batch_size:
+            db.session.execute(update, pending)
+            pending.clear()
+
+    rows = (
+        db.session.query(Result.user_id, Result.date, Result.difficulty,
+                         Result.minutes * 60 + Result.seconds, Result.backfilled)
+        .filter(*([Result.date <= end] if end else []))
+        .order_by(Result.user_id, Result.date)
+        .execution_options(yield_per=batch_size)
+    )
+    state, day, day_rows = None, None, {}
+    for user_id, d, diff, total, backfilled in rows:
+        if state is None or user_id != state.user_id:
+            if state is not None:
+                close(state, day, day_rows)
+            state, day, day_rows = HistoryState(user_id), d, {}
+        elif d != day:
+            close(state, day, day_rows)
+            day, day_rows = d, {}
+        day_rows[diff] = (total, backfilled)
+    if state is not None:
+        close(state, day, day_rows)
+    if pending:
+        db.session.execute(update, pending)
+
+    bump_data_version()
+    db.session.commit()
+    return written
+
+def build_standings(range_="week", sort="wins", page=1, per_page=LEADERBOARD_PER_PAGE):
+    # leaderboard de un rango de días desde las fotos diarias, sin tocar Result
+    if range_ not in STANDINGS_RANGES:
+        range_ = "week"
+    if sort not in STANDINGS_SORT_KEYS:
+        sort = "wins"
+    page = max(page, 1)
+    empty = {"data": [], "range": range_, "sort": sort, "page": page, "pages": 1, "offset": 0,
+             "start": None, "end": None}
+
+    end = db.session.query(db.func.max(DailyStanding.date)).scalar()
+    if end is None:
+        return empty
+    days = STANDINGS_RANGES[range_]
+    start = end - timedelta(days=days - 1) if days else None
+
+    s = DailyStanding
+    played = s.backfilled.is_(False)
+    board = (
+        db.session.query(
+            User.username.label("username"),
+            db.func.count(db.distinct(db.case((played, s.date)))).label("days"),
+            db.func.sum(db.case((db.and_(played, s.rank == 1), 1), else_=0)).label("wins"),
+            db.func.avg(db.case((played, s.rank))).label("avg_rank"),
+            *[
+                db.func.avg(db.case((db.and_(played, s.difficulty == diff), s.seconds))).label(f"avg_{diff.lower()}")
+                for diff in DIFFICULTIES
+            ],
+            # racha y estampillas al cierre del rango (el backfill deja fila para todos cada día)
+            db.func.max(db.case((s.date == end, s.streak))).label("streak"),
+            db.func.max(db.case((s.date == end, s.stamps))).label("stamps"),
+        )
+        .join(User, User.id == s.user_id)
+        .filter(s.date <= end, *([s.date >= start] if start else []), User.username != "admin")
+        .group_by(User.id, User.username)
+        .subquery()
+    )
+    # el total sale de la misma pasada (count() over ()) en vez de agregar el rango dos veces
+    column = board.c[sort]
+    order = column.asc() if STANDINGS_SORT_KEYS[sort] else column.desc()
+    rows = (
+        db.session.query(board, db.func.count().over().label("total"))
+        .order_by(order.nulls_last(), board.c.username.asc())
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+        .all()
+    )
+    total = rows[0].total if rows else db.session.query(db.func.count()).select_from(board).scalar()
+    data = []
+    for r in rows:
+        data.append({
+            "username": r.username,
+            "days": r.days,
+            "wins": r.wins or 0,
+            "avg_rank": float(r.avg_rank) if r.avg_rank is not None else None,
+            "avg_easy": float(r.avg_easy) if r.avg_easy else None,
+            "avg_medium": float(r.avg_medium) if r.avg_medium else None,
+            "avg_hard": float(r.avg_hard) if r.avg_hard else None,
+            "streak": r.streak or 0,
+            "stamps": r.stamps or 0,
+        })
+    pages = max((total + per_page - 1) // per_page, 1)
+    return dict(empty, data=data, pages=pages, offset=(page - 1) * per_page,
+                start=start.isoformat() if start else None, end=end.isoformat())
+
+def standings_for_day(day):
+    # {dificultad: filas ordenadas por puesto} de un día cerrado
+    rows = (
+        db.session.query(DailyStanding, User.username)
+        .join(User, User.id == DailyStanding.user_id)
+        .filter(DailyStanding.date == day, User.username != "admin")
+        # quien no jugó empata con el peor tiempo real: va después
+        .order_by(DailyStanding.difficulty, DailyStanding.rank, DailyStanding.backfilled, User.username)
+    )
+    by_diff = {diff: [] for diff in DIFFICULTIES}
+    for standing, username in rows:
+        by_diff.setdefault(standing.difficulty, []).append({
+            "username": username,
+            "rank": standing.rank,
+            "seconds": standing.seconds,
+            "backfilled": standing.backfilled,
+            "streak": standing.streak,
+            "stamps": standing.stamps,
+        })
+    return by_diff
+
+@app.cli.command("standings-rebuild")
+@click.option("--start", type=click.DateTime(["%Y-%m-%d"]), default=None)
+@click.option("--end", type=click.DateTime(["%Y-%m-%d"]), default=None)
+@click.option("--trust-legacy", is_flag=True, help="Reconstruir aunque haya resultados de antes de la columna backfilled.")
+@click.option("--batch-size", default=5000, show_default=True)
+def standings_rebuild_command(start, end, trust_legacy, batch_size):
+    refuse_legacy_history(trust_legacy)
+    started = time.perf_counter()
+    written = rebuild_standings(start and start.date(), end and end.date(), batch_size=batch_size)
+    print(f"Posiciones diarias reconstruidas: {written} filas en {time.perf_counter() - started:.2f}s")
+
+# Instrumentación
+# consultas y tiempos por request; los requests lentos se loguean con sus consultas más caras
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 500))
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "").lower() in ("1", "true", "yes")
+recent_requests = deque(maxlen=500)
+
+def request_metrics():
+    if not has_request_context():
+        return None
+    if "metrics" not in g:
+        g.metrics = {"start": time.perf_counter(), "queries": [], "phases": []}
+    return g.metrics
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    elapsed = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+    metrics = request_metrics()
+    if metrics is not None:
+        metrics["queries"].append((statement, elapsed))
+
+def timed(name, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        metrics = request_metrics()
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics["phases"].append((name, (time.perf_counter() - start) * 1000))
+    return wrapper
+
+def instrument_app():
+    # envuelve cada before_request y cada vista para medirlos por separado
+    app.before_request_funcs[None] = [timed(f.__name__, f) for f in app.before_request_funcs.get(None, [])]
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint != "static":
+            app.view_functions[endpoint] = timed(f"view:{endpoint}", view)
+
+@app.after_request
+def record_metrics(response):
+    metrics = g.pop("metrics", None)
+    if metrics is None:
+        return response
+    total = (time.perf_counter() - metrics["start"]) * 1000
+    db_time = sum(ms for _, ms in metrics["queries"])
+    summary = {
+        "endpoint": request.endpoint,
+        "method": request.method,
+        "status": response.status_code,
+        "total_ms": round(total, 2),
+        "db_ms": round(db_time, 2),
+        "queries": len(metrics["queries"]),
+        "phases": {name: round(ms, 2) for name, ms in metrics["phases"]},
+    }
+    recent_requests.append(summary)
+
+    if total > SLOW_REQUEST_MS:
+        top = sorted(metrics["queries"], key=lambda q: q[1], reverse=True)[:5]
+        app.logger.warning(
+            "Request lento %s %s: %.1fms, %d consultas (%.1fms en DB)\n%s",
+            request.method, request.path, total, len(metrics["queries"]), db_time,
+            "\n".join(f"  {ms:.1f}ms  {' '.join(stmt.split())[:300]}" for stmt, ms in top),
+        )
+
+    if app.debug or SERVER_TIMING:
+        timings = [f'db;dur={db_time:.1f};desc="{len(metrics["queries"])} consultas"']
+        timings += [f"{name.replace(':', '-')};dur={ms:.1f}" for name, ms in metrics["phases"]]
+        timings.append(f"total;dur={total:.1f}")
+        response.headers["Server-Timing"] = ", ".join(timings)
+    return response
+
+def metrics_summary():
+    # agregados por endpoint de los últimos requests de este proceso
+    endpoints = {}
+    for r in recent_requests:
+        e = endpoints.setdefault(r["endpoint"] or "-", {"requests": 0, "total_ms": 0.0, "queries": 0, "max_ms": 0.0})
+        e["requests"] += 1
+        e["total_ms"] += r["total_ms"]
+        e["queries"] += r["queries"]
+        e["max_ms"] = max(e["max_ms"], r["total_ms"])
+    for e in endpoints.values():
+        e["avg_ms"] = round(e.pop("total_ms") / e["requests"], 2)
+        e["avg_queries"] = round(e.pop("queries") / e["requests"], 2)
+    slow = [r for r in recent_requests if r["total_ms"] > SLOW_REQUEST_MS]
+    return {"slow_request_ms": SLOW_REQUEST_MS, "endpoints": endpoints, "slow": slow[-20:]}
+
+def is_admin():
+    user = current_user()
+    return user is not None and user.username == "admin"
+
+# Exportar / importar
+# cada tabla se exporta con usernames y nombres de estampilla (no ids) para poder cargarla en otra base
+EXPORT_BATCH = 1000
+
+def export_rows(table):
+    if table == "results":
+        columns = ["username", "difficulty", "date", "minutes", "seconds", "backfilled"]
+        query = (
+            db.session.query(User.username, Result.difficulty, Result.date, Result.minutes,
+                             Result.seconds, Result.backfilled)
+            .join(User, User.id == Result.user_id)
+            .order_by(Result.id)
+        )
+    elif table == "streaks":
+        columns = ["username", "current_streak", "last_played"]
+        query = db.session.query(User.username, User.current_streak, User.last_played).order_by(User.id)
+    elif table == "user_stamps":
+        columns = ["username", "stamp"]
+        query = (
+            db.session.query(User.username, Stamp.name)
+            .join(UserStamp, UserStamp.user_id == User.id)
+            .join(Stamp, Stamp.id == UserStamp.stamp_id)
+            .order_by(UserStamp.id)
+        )
+    else:
+        raise ValueError(f"tabla desconocida: {table}")
+    # cursor del lado del servidor: la memoria no crece con el tamaño de la tabla
+    rows = query.execution_options(stream_results=True, yield_per=EXPORT_BATCH)
+    return columns, rows
+
+def export_lines(table, fmt):
+    columns, rows = export_rows(table)
+    if fmt == "ndjson":
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % EXPORT_BATCH == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def read_rows(stream, fmt):
+    if fmt == "ndjson":
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(stream)
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "t", "yes")
+
+def parse_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value).strip())
+
+def validate_result(row):
+    if row["difficulty"] not in DIFFICULTIES:
+        raise ValueError(f"dificultad inválida: {row['difficulty']}")
+    minutes, seconds = int(row["minutes"]), int(row["seconds"])
+    if minutes < 0 or seconds < 0:
+        raise ValueError("tiempo negativo")
+    return {"difficulty": row["difficulty"], "date": parse_date(row["date"]), "minutes": minutes,
+            "seconds": seconds, "backfilled": parse_bool(row.get("backfilled", False))}
+
+def user_ids(usernames, create):
+    # {username: id}; los usuarios que faltan se crean sin contraseña válida (no pueden loguearse)
+    ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(usernames)))
+    missing = [u for u in usernames if u not in ids]
+    if missing and create:
+        today = datetime.now(pytz.timezone("Europe/Paris")).date()
+        insert_ignore(User, [{"username": u, "password_hash": "!", "current_streak": 0, "last_played": today}
+                             for u in missing])
+        ids.update(db.session.query(User.username, User.id).filter(User.username.in_(missing)))
+    return ids
+
+def import_batch(table, batch, create_users):
+    ids = user_ids({row["username"] for row in batch}, create_users)
+    rows = [row for row in batch if row["username"] in ids]
+    skipped = len(batch) - len(rows)
+
+    # Core (no ORM) para el executemany: el camino bulk del ORM es varias veces más lento
+    if table == "results":
+        stmt = dialect_insert(Result.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=UNIQUE_KEYS[Result],
+            set_={c: stmt.excluded[c] for c in ("minutes", "seconds", "backfilled")},
+        )
+        values = [dict(row["data"], user_id=ids[row["username"]]) for row in rows]
+    elif table == "streaks":
+        values = [dict(row["data"], id=ids[row["username"]]) for row in rows]
+        if values:
+            db.session.execute(db.update(User), values)
+        return len(values), skipped
+    else:
+        catalog = stamp_catalog()
+        rows = [row for row in rows if row["data"]["stamp"] in catalog]
+        skipped = len(batch) - len(rows)
+        stmt = dialect_insert(UserStamp.__table__).on_conflict_do_nothing(index_elements=UNIQUE_KEYS[UserStamp])
+        values = [{"user_id": ids[row["username"]], "stamp_id": catalog[row["data"]["stamp"]]["id"]}
+                  for row in rows]
+    if values:
+        db.session.connection().execute(stmt, values)  # executemany en lotes
+    return len(values), skipped
+
+IMPORT_VALIDATORS = {
+    "results": validate_result,
+    "streaks": lambda row: {"current_streak": int(row["current_streak"]), "last_played": parse_date(row["last_played"])},
+    "user_stamps": lambda row: {"stamp": row["stamp"]},
+}
+
+def import_rows(table, rows, batch_size=5000, create_users=False, progress=None):
+    # valida y hace upsert por lotes; devuelve un reporte con filas/s y errores
+    validate = IMPORT_VALIDATORS[table]
+    report = {"read": 0, "written": 0, "skipped": 0, "errors": []}
+    started = time.perf_counter()
+    batch = []
+
+    def flush():
+        written, skipped = import_batch(table, batch, create_users)
+        db.session.commit()
+        report["written"] += written
+        report["skipped"] += skipped
+        batch.clear()
+        if progress:
+            progress(report, time.perf_counter() - started)
+
+    for line, row in enumerate(rows, 1):
+        report["read"] += 1
+        try:
+            batch.append({"username": row["username"].strip(), "data": validate(row)})
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            report["errors"].append((line, str(e)))
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    if table == "results":
+        rebuild_rollup()  # también incrementa la versión de datos
+    else:
+        bump_data_version()
+        db.session.commit()
+    report["seconds"] = time.perf_counter() - started
+    return report
+
+@app.cli.command("export")
+@click.argument("table", type=click.Choice(["results", "streaks", "user_stamps"]))
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), default="csv", show_default=True)
+def export_command(table, fmt):
+    for chunk in export_lines(table, fmt):
+        sys.stdout.write(chunk)
+
+@app.cli.command("import-data")
+@click.argument("table", type=click.Choice(["results", "streaks", "user_stamps"]))
+@click.argument("source", type=click.File("r", encoding="utf-8"))
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), default=None,
+              help="Por defecto según la extensión del archivo.")
+@click.option("--batch-size", default=5000, show_default=True)
+@click.option("--create-users", is_flag=True, help="Crear los usuarios que no existan (sin contraseña).")
+def import_command(table, source, fmt, batch_size, create_users):
+    fmt = fmt or ("ndjson" if source.name.endswith((".ndjson", ".jsonl")) else "csv")
+
+    def progress(report, elapsed):
+        rate = report["read"] / elapsed if elapsed else 0
+        print(f"  {report['read']:>10,} leídas  {report['written']:>10,} escritas  {rate:>10,.0f} filas/s", file=sys.stderr)
+
+    report = import_rows(table, read_rows(source, fmt), batch_size=batch_size,
+                         create_users=create_users, progress=progress)
+    rate = report["read"] / report["seconds"] if report["seconds"] else 0
+    print(f"{report['written']:,} filas escritas de {report['read']:,} en {report['seconds']:.2f}s ({rate:,.0f} filas/s)")
+    print(f"omitidas (usuario o estampilla inexistente): {report['skipped']:,}, inválidas: {len(report['errors']):,}")
+    for line, error in report["errors"][:10]:
+        print(f"  línea {line}: {error}")
+
+# Envío de resultados
+def lock_user(user_id):
+    # UPDATE sin cambios en vez de SELECT ... FOR UPDATE: SQLite ignora FOR UPDATE pero este
+    # UPDATE toma el lock de escritura; en Postgres bloquea la fila igual. Dos envíos del mismo
+    # usuario (doble click, dos pestañas) quedan en fila y el segundo ve lo que guardó el primero.
+    return db.session.execute(
+        db.update(User).where(User.id == user_id)
+        .values(current_streak=User.current_streak)
+        .returning(User.current_streak, User.last_played)
+    ).one_or_none()
+
+def parse_submission(form, skip):
+    results = {}
+    for diff in DIFFICULTIES:
+        if diff in skip:
+            continue
+        minutes = form.get(f"{diff.lower()}_min")
+        seconds = form.get(f"{diff.lower()}_sec")
+        if minutes or seconds:
+            results[diff] = int(minutes or 0) * 60 + int(seconds or 0)
+    return results
+
+def submit_results(user_id, form, now):
+    # una transacción: lock del usuario, un snapshot, inserts y racha calculados en memoria.
+    # Devuelve (dificultades guardadas, estampillas ganadas); el commit queda a cargo de quien llama.
+    today = now.date()
+    locked = lock_user(user_id)
+    if locked is None:
+        return None, []
+    streak, last_played = locked
+    snapshot, played_today = load_stamp_snapshot(user_id, now, streak)
+
+    totals = parse_submission(form, skip=played_today)
+    if not totals:
+        return [], []
+    # con el lock no debería haber conflicto; el índice único queda como última defensa
+    saved = insert_ignore(Result, [
+        {"user_id": user_id, "difficulty": diff, "date": today, "minutes": total // 60, "seconds": total % 60}
+        for diff, total in totals.items()
+    ], returning=Result.difficulty)
+    if not saved:
+        return [], []
+    add_to_rollup([
+        {"user_id": user_id, "difficulty": diff, "results": 1, "total_seconds": totals[diff],
+         "best_seconds": totals[diff], "last_date": today}
+        for diff in saved
+    ])
+    for diff in saved:
+        played_today.add(diff)
+        snapshot.results[(today, diff)] = totals[diff]
+
+    if played_today >= set(DIFFICULTIES):
+        snapshot.streak = streak + 1 if last_played == today - timedelta(days=1) else 1
+        db.session.execute(
+            db.update(User).where(User.id == user_id)
+            .values(current_streak=snapshot.streak, last_played=today)
+        )
+
+    bump_data_version()
+    return {diff: totals[diff] for diff in saved}, award_stamps(snapshot)
+
+# Eventos en vivo
+# /events (Server-Sent Events): cada envío publica la fila nueva del leaderboard y los puntos nuevos
+# de los gráficos. El evento se arma una vez (unas pocas consultas) y se reparte a todos los que
+# miran, sin trabajo de base por oyente. Con EVENTS_URL (Redis) el reparto cruza instancias.
+EVENTS_BACKLOG = int(os.environ.get("EVENTS_BACKLOG", 500))
+EVENTS_HEARTBEAT = float(os.environ.get("EVENTS_HEARTBEAT", 15))
+# serverless corta las conexiones largas: cerrar antes y que EventSource reconecte con Last-Event-ID
+EVENTS_MAX_SECONDS = float(os.environ.get("EVENTS_MAX_SECONDS", 25 if os.environ.get("VERCEL") else 0))
+# en Vercel sin EVENTS_URL cada función tiene su propio broker y casi nadie recibe nada: las páginas no
+# abren EventSource salvo que se pida con LIVE_EVENTS=1
+LIVE_EVENTS = env_flag("LIVE_EVENTS", bool(os.environ.get("EVENTS_URL")) or not os.environ.get("VERCEL"))
+
+class EventBroker:
+    # pub/sub en memoria del proceso; los últimos eventos quedan para los que reconectan
+    def __init__(self, backlog=EVENTS_BACKLOG):
+        self.events = deque(maxlen=backlog)  # (id, tópico, mensaje SSE ya serializado)
+        self.condition = threading.Condition()
+        self.last_id = 0
+        self.listeners = 0
+
+    def publish(self, topic, data):
+        with self.condition:
+            self.deliver(self.last_id + 1, topic, data)
+
+    def deliver(self, event_id, topic, data):
+        message = f"id: {event_id}\nevent: {topic}\ndata: {json.dumps(data)}\n\n"
+        with self.condition:
+            self.last_id = max(self.last_id, event_id)
+            self.events.append((event_id, topic, message))
+            self.condition.notify_all()
+
+    def pending(self, last_id):
+        # eventos posteriores a last_id, recorriendo solo los nuevos desde el final
+        new = []
+        for event in reversed(self.events):
+            if event[0] <= last_id:
+                break
+            new.append(event)
+        return new[::-1]
+
+    def listen(self, last_id=None, heartbeat=EVENTS_HEARTBEAT, deadline=None):
+        # genera (id, tópico, mensaje); None cada `heartbeat` segundos sin novedades y
+        # (id, "reset", ...) si last_id ya no está en el backlog (o es de antes de un reinicio).
+        # Termina al llegar a `deadline` (time.monotonic()) aunque no haya pasado el heartbeat.
+        with self.condition:
+            self.listeners += 1
+            reset = last_id is not None and (
+                last_id > self.last_id or bool(self.events and last_id < self.events[0][0] - 1)
+            )
+            if last_id is None or reset:
+                last_id = self.last_id
+        try:
+            if reset:
+                yield last_id, "reset", f"id: {last_id}\nevent: reset\ndata: {{}}\n\n"
+            while True:
+                timeout = heartbeat
+                if deadline is not None:
+                    timeout = min(timeout, deadline - time.monotonic())
+                    if timeout <= 0:
+                        return
+                with self.condition:
+                    new = self.pending(last_id)
+                    if not new:
+                        self.condition.wait(timeout)
+                        new = self.pending(last_id)
+                if not new and timeout >= heartbeat:
+                    yield None
+                for event in new:
+                    last_id = event[0]
+                    yield event
+        finally:
+            with self.condition:
+                self.listeners -= 1
+
+class SharedEventBroker(EventBroker):
+    # varias instancias: los ids salen de un contador compartido y un hilo por proceso
+    # reparte localmente lo que llega por el canal (cualquier cliente con incr/publish/pubsub tipo Redis)
+    def __init__(self, client, channel="pips:events", backlog=EVENTS_BACKLOG):
+        super().__init__(backlog)
+        self.client = client
+        self.channel = channel
+        self.relay_thread = None
+
+    def publish(self, topic, data):
+        event_id = self.client.incr(self.channel + ":id")
+        self.client.publish(self.channel, json.dumps([event_id, topic, data]))
+
+    def listen(self, last_id=None, heartbeat=EVENTS_HEARTBEAT, deadline=None):
+        self.start_relay()
+        yield from super().listen(last_id, heartbeat, deadline)
+
+    def start_relay(self):
+        with self.condition:
+            if self.relay_thread is not None:
+                return
+            self.last_id = int(self.client.get(self.channel + ":id") or 0)
+            self.relay_thread = threading.Thread(target=self.relay, daemon=True)
+            self.relay_thread.start()
+
+    def relay(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            event_id, topic, data = json.loads(message["data"])
+            self.deliver(event_id, topic, data)
+
+def make_broker():
+    url = os.environ.get("EVENTS_URL")
+    if url:
+        import redis  # opcional: solo si se configura EVENTS_URL
+        return SharedEventBroker(redis.Redis.from_url(url))
+    return EventBroker()
+
+broker = make_broker()
+
+@app.context_processor
+def inject_live_events():
+    return {"live_events": LIVE_EVENTS}
+
+def publish_submission(user_id, day, totals):
+    # fila del leaderboard y puntos nuevos en el formato de delta que ya entiende charts.js
+    row = leaderboard_query().filter(User.id == user_id).first()
+    if row is None:
+        return
+    broker.publish("leaderboard", leaderboard_rows([row])[0])
+    averages = historical_averages()
+    broker.publish("stats", {
+        diff: {
+            "dates": [day.isoformat()],
+            "labels": [day.strftime("%d/%m")],
+            "datasets": [average_line(float(averages[diff]), 1), {"label": row.username, "data": [total]}],
+        }
+        for diff, total in totals.items()
+    })
+
+def event_stream(last_id, topics):
+    # sin contexto de app: el generador no toca la base mientras está abierto
+    # el límite se pasa al broker: un stream sin novedades cierra a tiempo, no en el heartbeat siguiente
+    deadline = time.monotonic() + EVENTS_MAX_SECONDS if EVENTS_MAX_SECONDS else None
+    events = broker.listen(last_id, deadline=deadline)
+    try:
+        yield "retry: 3000\n\n"
+        for event in events:
+            if event is None:
+                yield ": ping\n\n"
+            elif event[1] in topics or event[1] == "reset":
+                yield event[2]
+    finally:
+        events.close()
+
+# Usuario del request
+def current_user():
+    # se carga como mucho una vez por request, y solo si alguien lo necesita
+    if "_user" not in g:
+        g._user = db.session.get(User, session["user_id"]) if "user_id" in session else None
+    return g._user
+
+def streak_color(streak, active):
+    if not active:
+        # gris cuando no jugó hoy
+        return "#3b3b3b"
+    # Paleta por rangos
+    if streak >= 50:
+        return "#ef4444"  # rojo extremo
+    elif streak >= 30:
+        return "#3b82f6"  # violeta
+    elif streak >= 10:
+        return "#ffcc3e"  # amarillo
+    elif streak >= 5:
+        return "#22c55e"  # verde
+    return "#aaf7ff"  # neutro oscuro para rachas pequeñas
+
+# hora (UTC) del cron /cron/backfill en vercel.json
+BACKFILL_AT = os.environ.get("BACKFILL_AT", "23:10")
+
+def next_backfill(now=None):
+    now = now or datetime.now(timezone.utc)
+    hour, minute = map(int, BACKFILL_AT.split(":"))
+    at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return at if at > now else at + timedelta(days=1)
+
+def make_badge(user):
+    # calcular si jugó HOY (Europe/Paris)
+    today = datetime.now(pytz.timezone("Europe/Paris")).date()
+    streak = user.current_streak or 0
+    active = user.last_played == today
+    return {
+        "user_id": user.id,
+        "day": today.isoformat(),
+        "username": user.username,
+        "streak": streak,
+        "active": active,
+        "color": streak_color(streak, active),
+        "version": data_version(),
+        "valid_until": int(next_backfill().timestamp()),
+    }
+
+def streak_badge():
+    # badge del header guardado en la sesión firmada: vale hasta el cambio de día (Paris) o hasta el
+    # próximo backfill, sin consultas. submit() lo descarta; un envío desde otro dispositivo solo se
+    # nota si la vista ya leyó la versión de datos (las cacheadas), si no al backfill siguiente.
+    if "user_id" not in session:
+        return None
+    badge = session.get("badge")
+    today = datetime.now(pytz.timezone("Europe/Paris")).date().isoformat()
+    if (not badge or badge["day"] != today or badge["user_id"] != session["user_id"]
+            or time.time() >= badge.get("valid_until", 0)
+            or ("data_version" in g and badge.get("version") != g.data_version)):
+        user = current_user()
+        if user is None:
+            return None
+        badge = make_badge(user)
+        session["badge"] = badge
+    return badge
+
+@app.context_processor
+def inject_badge():
+    return {"badge": streak_badge()}
+
+# Archivos estáticos
+# url_for('static', ...) agrega ?v=<hash del contenido> y con esa versión la respuesta se cachea un año
+# como inmutable. Los hashes (y el tamaño de las imágenes) se precalculan con
+# "flask --app index build-assets" en static/manifest.json, pero solo se confía en el manifest para los
+# archivos grandes (ej. cp.mp3) que no cambiaron de tamaño: el resto se vuelve a hashear al cargarlo
+# (unos cientos de KB, una vez por proceso), así un CSS editado con el mismo largo no queda con la
+# versión vieja cacheada un año. Lo que no está en el manifest se hashea la primera vez que se pide.
+ASSET_MANIFEST = os.path.join(app.static_folder, "manifest.json")
+ASSET_MAX_AGE = 365 * 24 * 3600
+ASSET_REHASH_BYTES = int(os.environ.get("ASSET_REHASH_BYTES", 512 * 1024))
+_assets = {"files": None}
+
+def image_size(path):
+    # (ancho, alto) de un .webp leyendo solo la cabecera, sin Pillow
+    with open(path, "rb") as f:
+        head = f.read(30)
+    if len(head) < 30 or head[:4] != b"RIFF" or head[8:12] != b"WEBP":
+        return None
+    chunk = head[12:16]
+    if chunk == b"VP8X":
+        return 1 + int.from_bytes(head[24:27], "little"), 1 + int.from_bytes(head[27:30], "little")
+    if chunk == b"VP8L":
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8 ":
+        return int.from_bytes(head[26:28], "little") & 0x3FFF, int.from_bytes(head[28:30], "little") & 0x3FFF
+    return None
+
+def asset_entry(path):
+    full = os.path.join(app.static_folder, path)
+    digest = hashlib.sha1()
+    with open(full, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    entry = {"hash": digest.hexdigest()[:12], "bytes": os.path.getsize(full)}
+    size = image_size(full) if path.endswith(".webp") else None
+    if size:
+        entry["width"], entry["height"] = size
+    return entry
+
+def build_manifest():
+    files = {}
+    for root, _, names in os.walk(app.static_folder):
+        for name in sorted(names):
+            path = os.path.relpath(os.path.join(root, name), app.static_folder).replace(os.sep, "/")
+            if path != "manifest.json":
+                files[path] = asset_entry(path)
+    return files
+
+def load_manifest():
+    try:
+        with open(ASSET_MANIFEST) as f:
+            files = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # un archivo editado sin volver a correr build-assets no debe quedar con el hash viejo
+    fresh = {}
+    for path, entry in files.items():
+        full = os.path.join(app.static_folder, path)
+        if not os.path.isfile(full) or os.path.getsize(full) != entry["bytes"]:
+            continue
+        fresh[path] = asset_entry(path) if entry["bytes"] <= ASSET_REHASH_BYTES else entry
+    return fresh
+
+def asset(path):
+    # entrada del manifest de un archivo de static/ (None si no existe)
+    if _assets["files"] is None:
+        _assets["files"] = load_manifest()
+    files = _assets["files"]
+    if path not in files:
+        full = safe_join(app.static_folder, path)
+        if full is None or not os.path.isfile(full):
+            return None
+        files[path] = asset_entry(path)
+    return files[path]
+
+@app.url_defaults
+def fingerprint_static(endpoint, values):
+    if endpoint == "static" and "v" not in values:
+        entry = asset(values.get("filename", ""))
+        if entry:
+            values["v"] = entry["hash"]
+
+@app.after_request
+def static_cache_headers(response):
+    # sin ?v= o con una versión vieja queda el comportamiento normal (revalidar con ETag)
+    if request.endpoint == "static" and response.status_code in (200, 206, 304):
+        entry = asset(request.view_args["filename"])
+        if entry and request.args.get("v") == entry["hash"]:
+            response.cache_control.public = True
+            response.cache_control.max_age = ASSET_MAX_AGE
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+    return response
+
+@app.context_processor
+def inject_assets():
+    def asset_size(path):
+        # (ancho, alto) para reservar el espacio de la imagen antes de que cargue
+        entry = asset(path) or {}
+        return entry.get("width"), entry.get("height")
+    return {"asset_size": asset_size}
+
+@app.cli.command("build-assets")
+@click.option("--check", is_flag=True, help="Solo verificar que static/manifest.json esté al día.")
+def build_assets_command(check):
+    files = build_manifest()
+    if check:
+        try:
+            with open(ASSET_MANIFEST) as f:
+                current = json.load(f)
+        except (OSError, ValueError):
+            current = {}
+        stale = sorted(path for path in files.keys() | current.keys() if files.get(path) != current.get(path))
+        for path in stale:
+            print(f"desactualizado: {path}")
+        print("✅ Manifest al día" if not stale else f"❌ {len(stale)} archivos desactualizados")
+        raise SystemExit(1 if stale else 0)
+    with open(ASSET_MANIFEST, "w") as f:
+        json.dump(files, f, indent=2, sort_keys=True)
+        f.write("\n")
+    _assets["files"] = files
+    print(f"{len(files)} archivos en static/manifest.json")
 
 b = True
 # Rutas
@@ -155,9 +2095,17 @@ def index():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
+        wait = throttled(username)
+        if wait:
+            return too_many_attempts("login.html", wait)
         user = User.query.filter_by(username=username).first()
         if user and user.check_password(password):
+            login_limiter.reset(user_key(username, request.remote_addr))
+            if user.password_outdated():
+                user.set_password(password)
+                db.session.commit()
             session["user_id"] = user.id
+            session["badge"] = make_badge(user)
             return redirect(url_for("dashboard"))
         flash("Usuario o contraseña incorrectos", "error")
     return render_template("login.html")
@@ -169,12 +2117,16 @@ def register():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
+        wait = throttled()
+        if wait:
+            return too_many_attempts("register.html", wait)
         if User.query.filter_by(username=username).first():
             flash("El usuario ya existe", "error")
             return render_template("register.html")
         user = User(username=username)
         user.set_password(password)
         db.session.add(user)
+        bump_data_version()  # aparece en el leaderboard
         db.session.commit()
         flash("Usuario creado correctamente", "success")
         return redirect(url_for("index"))
@@ -195,124 +2147,33 @@ def submit():
         return redirect(url_for("index"))
 
     user_id = session["user_id"]
-    user = User.query.get(user_id)
-    local_tz = pytz.timezone("Europe/Paris")
-    today = datetime.now(local_tz).date()
-
-    #{nombre: Stamp()}
-    stamps_racha = {s.name: s for s in Stamp.query.filter(
-    Stamp.name.in_(["Racha corta", "Racha media", "Racha larga", "Racha extrema"])).all()}
-    stamps_tiempo = {s.name: s for s in Stamp.query.filter(
-    Stamp.name.in_(["Manos ágiles", "Manos rápidas", "Manos turbo", "Speedrun"])).all()}
-    stamps_misc = {s.name: s for s in Stamp.query.filter(
-    Stamp.name.in_(["Precoz"])).all()}
-    
+    now = datetime.now(pytz.timezone("Europe/Paris"))
 
     #Flag con la categoria de la stamp
     session["won_stamps"] = []
     session["won_stamp_names"] = []
 
-    # Ver qué dificultades ya fueron ingresadas hoy
-    submitted_results = Result.query.filter_by(user_id=user_id, date=today).all()
-    submitted_today = {d: False for d in ["Easy","Medium","Hard"]}
-    for r in submitted_results:
-        submitted_today[r.difficulty] = True
-
-    
     if request.method == "POST":
-
-        #{Dificultad: nombre}
-        stamp_mapping = {
-            "Easy": "Manos ágiles",
-            "Medium": "Manos rápidas",
-            "Hard": "Manos turbo",
-            "Extreme": "Speedrun"
-        }
-
-        #{Dificultad: segundos}
-        limites_stamp_tiempo = {
-            "Easy": 15, 
-            "Medium": 45,
-            "Hard": 60
-        }
-
-        #Ganas speedrun si llega a 3
-        speedrun_flag = 0
-
-        for diff in ["Easy","Medium","Hard"]:
-
-            if not submitted_today[diff]:
-                min_field = f"{diff.lower()}_min"
-                sec_field = f"{diff.lower()}_sec"
-                if request.form.get(min_field) or request.form.get(sec_field):
-                    minutes = 0
-                    seconds = 0
-                    if request.form.get(min_field): 
-                        minutes = int(request.form[min_field])
-                        
-                    if request.form.get(sec_field): 
-                        seconds = int(request.form[sec_field])
-                        
-                    result = Result(user_id=user_id, difficulty=diff, date=today,
-                                    minutes=minutes, seconds=seconds)
-                    
-                    if minutes == 0 and seconds < 50: 
-                        speedrun_flag += 1
-
-                    possible_stamp = stamps_tiempo.get(stamp_mapping[diff])
-                    if minutes*60 + seconds < limites_stamp_tiempo[diff] and not UserStamp.query.filter_by(user_id=user.id, stamp_id=possible_stamp.id).first():
-                        db.session.add(UserStamp(user_id=user.id, stamp_id=possible_stamp.id))
-
-                        session["won_stamps"].append(possible_stamp.category)
-                        session["won_stamp_names"].append(possible_stamp.name)
-
-                    db.session.add(result)
-                    submitted_today[diff] = True  # marcar como ingresado
-        
-        if all(submitted_today.values()):
-            # obtener los 3 resultados de hoy
-            results_today = Result.query.filter_by(user_id=user.id, date=today).all()
-
-            # contar cuántos son <50 segundos
-            under_50 = 0
-            for r in results_today:
-                if r.minutes == 0 and r.seconds < 50:
-                    under_50 += 1
-
-            # si los 3 lo cumplen → speedrun
-            if under_50 == 3:
-                speedrun_stamp = stamps_tiempo.get("Speedrun")
-                if speedrun_stamp and not UserStamp.query.filter_by(user_id=user.id, stamp_id=speedrun_stamp.id).first():
-                    db.session.add(UserStamp(user_id=user.id, stamp_id=speedrun_stamp.id))
-                    session["won_stamps"].append(speedrun_stamp.category)
-                    session["won_stamp_names"].append(speedrun_stamp.name)
-
-            yesterday = today - timedelta(days=1)
-            if user.last_played == yesterday:
-                user.current_streak += 1
-                rachas = {5: "Racha corta", 10: "Racha media", 30: "Racha larga", 50: "Racha extrema"}
-                for days, stamp_name in rachas.items():
-                    if user.current_streak == days:
-                        stamp = stamps_racha.get(stamp_name)
-                        if stamp and not UserStamp.query.filter_by(user_id=user.id, stamp_id=stamp.id).first():
-                            db.session.add(UserStamp(user_id=user.id, stamp_id=stamp.id))
-                            session["won_stamps"].append(stamp.category)
-                            session["won_stamp_names"].append(stamp_name)
-            else:   
-                user.current_streak = 1
-            user.last_played = today
-
-            stamp_precoz = stamps_misc.get("Precoz")
-            if not UserStamp.query.filter_by(user_id=user.id, stamp_id=stamp_precoz.id).first() and datetime.now().strftime("%H") == "00" and int(datetime.now().strftime("%M")) < 5: 
-                db.session.add(UserStamp(user_id=user.id, stamp_id=stamp_precoz.id))
-                session["won_stamps"].append(stamp_precoz.category)
-                session["won_stamp_names"].append("Precoz")
-                
-
+        saved, won = submit_results(user_id, request.form, now)
+        if saved is None:
+            return redirect(url_for("logout"))
+        for stamp in won:
+            session["won_stamps"].append(stamp["category"])
+            session["won_stamp_names"].append(stamp["name"])
         db.session.commit()
+        if saved:
+            session.pop("badge", None)  # la racha pudo cambiar
+            try:
+                publish_submission(user_id, now.date(), saved)
+            except Exception:
+                # los resultados ya están guardados: un fallo al avisar no debe romper el envío
+                app.logger.exception("No se pudo publicar el envío")
         flash("Resultados guardados", "success")
         return redirect(url_for("dashboard"))
-    
+
+    # Ver qué dificultades ya fueron ingresadas hoy
+    played = {diff for (diff,) in db.session.query(Result.difficulty).filter_by(user_id=user_id, date=now.date())}
+    submitted_today = {d: d in played for d in DIFFICULTIES}
     return render_template("submit.html", submitted_today=submitted_today)
 
     
@@ -322,61 +2183,9 @@ def stats():
     if "user_id" not in session:
         return redirect(url_for("index"))
 
-    # Obtener todos los resultados
-    results = Result.query.join(User).add_columns(
-        User.username, Result.difficulty, Result.date, Result.minutes, Result.seconds
-    ).all()
-
-    difficulties = ["Easy", "Medium", "Hard"]
-    data_by_diff = {}
-
-    for diff in difficulties:
-        # filtrar resultados por dificultad
-        diff_results = [r for r in results if r.difficulty == diff]
-
-        # obtener todas las fechas únicas y ordenarlas
-        dates = sorted({r.date for r in diff_results})
-        labels = [d.strftime("%d/%m") for d in dates]
-
-        # obtener todos los usuarios que tienen resultados
-        users = sorted({r.username for r in diff_results})
-        datasets = []
-                # Calcular promedio histórico (en segundos)
-        all_seconds = [
-            r.minutes * 60 + r.seconds
-            for r in diff_results
-        ]
-        avg_historical = sum(all_seconds) / len(all_seconds) if all_seconds else None
-
-        if avg_historical is not None:
-            avg_data = [avg_historical for _ in dates]
-            datasets.append({
-                "label": "Promedio histórico",
-                "data": avg_data,
-                "borderDash": [5, 5],  # línea punteada
-                "borderColor": "rgba(255, 255, 255, 0.8)",
-                "backgroundColor": "transparent",
-                "tension": 0,
-                "pointRadius": 0
-            })
-
-        for u in users:
-            # para cada fecha, poner el tiempo en segundos o None si no hay
-            if u == "admin":
-                continue
-            data = []
-            for d in dates:
-                r = next((res for res in diff_results if res.username == u and res.date == d), None)
-                if r:
-                    total_seconds = r.minutes*60 + r.seconds
-                    data.append(total_seconds)
-                else:
-                    data.append(None)
-            datasets.append({"label": u, "data": data})
-
-        data_by_diff[diff] = {"labels": labels, "datasets": datasets}
-
-    return render_template("stats.html", difficulties=difficulties, data_by_diff=data_by_diff)
+    # los datos los pide la página a /api/stats (con ETag y deltas)
+    days = days_arg()
+    return render_template("stats.html", difficulties=DIFFICULTIES, days=days, points=STATS_POINT_BUDGET)
 
 @app.route('/personalstats')
 def personalstats():
@@ -384,42 +2193,18 @@ def personalstats():
         return redirect(url_for("index"))
 
     user_id = session["user_id"]
-    difficulties = ["Easy", "Medium", "Hard"]
-    data_by_diff = {}
-
-    for diff in difficulties:
-        diff_results = (Result.query
-                        .filter_by(user_id=user_id, difficulty=diff)
-                        .order_by(Result.date.asc())
-                        .all())
-
-        labels = [r.date.strftime("%d/%m") for r in diff_results]
-        values = [r.minutes * 60 + r.seconds for r in diff_results]
-
-        datasets = []
-        if values:
-            avg = sum(values) / len(values)
-            datasets.append({
-                "label": "Promedio histórico",
-                "data": [avg] * len(values),
-                "borderDash": [5, 5],
-                "borderColor": "rgba(255, 255, 255, 0.8)",
-                "backgroundColor": "transparent",
-                "tension": 0,
-                "pointRadius": 0
-            })
-            datasets.append({"label": "Tus tiempos", "data": values})
-
-        data_by_diff[diff] = {"labels": labels, "datasets": datasets}
-
-    # 👇 calcula si hay al menos una etiqueta (dato) en cualquier dificultad
-    has_data = any(len(data_by_diff[d]["labels"]) > 0 for d in difficulties)
+    # hay datos si el rollup tiene alguna fila del usuario
+    has_data = db.session.query(ResultRollup.user_id).filter_by(user_id=user_id).first() is not None
+    analytics = cached("analytics", user_id, build=lambda: user_analytics([user_id]).get(user_id, {}))
+    days = days_arg()
 
     return render_template(
         "personalstats.html",
-        difficulties=difficulties,
-        data_by_diff=data_by_diff,
-        has_data=has_data  # 👈 pásalo al template
+        difficulties=DIFFICULTIES,
+        days=days,
+        has_data=has_data,
+        analytics=analytics,
+        points=STATS_POINT_BUDGET
     )
 
 @app.route('/estampillas')
@@ -428,10 +2213,8 @@ def estampillas():
         return redirect(url_for("index"))
     user_id = session["user_id"]
 
-    # todas las estampillas
-    stamps = Stamp.query.order_by(Stamp.category, Stamp.id).all()
-    for stamp in stamps: 
-        print(stamp.image)
+    # todas las estampillas (catálogo en memoria, ya ordenado por categoría)
+    stamps = list(stamp_catalog().values())
     # ids de las estampillas del usuario
     user_stamps = {us.stamp_id for us in UserStamp.query.filter_by(user_id=user_id).all()}
 
@@ -442,48 +2225,191 @@ def leaderboard():
     if "user_id" not in session: 
         return redirect(url_for("index"))
 
-    # Obtener todos los usuarios excepto admin
-    users = User.query.filter(User.username != "admin").all()
+    sort = request.args.get("sort", "streak")
+    page = request.args.get("page", 1, type=int)
+    board = cached("leaderboard", sort, page, build=lambda: build_leaderboard(sort=sort, page=page))
 
-    data = []
-    for u in users:
-        # Racha
-        streak = u.current_streak
+    return render_template("leaderboard.html", sort_keys=LEADERBOARD_SORT_KEYS, **board)
 
-        # Estampillas
-        stamp_count = UserStamp.query.filter_by(user_id=u.id).count()
+    
 
-        # Promedios
-        averages = {}
-        for diff in ["Easy", "Medium", "Hard"]:
-            res = db.session.query(
-                db.func.avg(Result.minutes*60 + Result.seconds)
-            ).filter_by(user_id=u.id, difficulty=diff).scalar()
-            averages[diff] = res if res else None
 
-        data.append({
-            "username": u.username,
-            "streak": streak,
-            "stamps": stamp_count,
-            "avg_easy": averages["Easy"],
-            "avg_medium": averages["Medium"],
-            "avg_hard": averages["Hard"],
-        })
 
-    return render_template("leaderboard.html", data=data)
+@app.route('/standings')
+def standings():
+    if "user_id" not in session:
+        return redirect(url_for("index"))
 
-    
+    day = day_arg()
+    if day:
+        return render_template(
+            "standings.html",
+            day=day.isoformat(),
+            # sin enlace en los extremos de date: day ± 1 desbordaría
+            previous_day=(day - timedelta(days=1)).isoformat() if day > date.min else None,
+            next_day=(day + timedelta(days=1)).isoformat() if day < date.max else None,
+            end=None,
+            standings=cached("standings_day", day, build=lambda: standings_for_day(day)),
+        )
 
+    range_ = request.args.get("range", "week")
+    sort = request.args.get("sort", "wins")
+    page = request.args.get("page", 1, type=int)
+    board = cached("standings", range_, sort, page, build=lambda: build_standings(range_, sort=sort, page=page))
+    return render_template("standings.html", day=None, **board)
+
+# API JSON: ETag fuerte derivado de la versión de datos, 304 si no cambió nada
+def json_payload(name, *parts, build):
+    etag = hashlib.sha1(json.dumps([name, data_version(), *parts], default=str).encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(cached(name, *parts, build=build))
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def since_arg():
+    try:
+        return date.fromisoformat(request.args["since"]) if request.args.get("since") else None
+    except ValueError:
+        abort(400)
+
+def points_arg():
+    # presupuesto de puntos por serie: 0 = sin límite, los valores chicos los sube downsample()
+    points = request.args.get("points", type=int)
+    if points is not None and points < 0:
+        abort(400)
+    return points
+
+def days_arg():
+    # ventana en días: None/0 = toda la historia
+    days = request.args.get("days", type=int)
+    if days is not None and not 0 <= days <= STATS_MAX_DAYS:
+        abort(400)
+    return days
+
+def day_arg():
+    try:
+        return date.fromisoformat(request.args["day"]) if request.args.get("day") else None
+    except ValueError:
+        abort(400)
+
+@app.route('/api/stats')
+def api_stats():
+    if "user_id" not in session:
+        return {"error": "unauthorized"}, 401
+    days = days_arg()
+    since = since_arg()
+    points = points_arg()
+    return json_payload("stats", days, since, points,
+                        build=lambda: build_stats(days=days, since=since, points=points))
+
+@app.route('/api/personalstats')
+def api_personalstats():
+    if "user_id" not in session:
+        return {"error": "unauthorized"}, 401
+    user_id = session["user_id"]
+    days = days_arg()
+    since = since_arg()
+    points = points_arg()
+    return json_payload("personalstats", user_id, days, since, points,
+                        build=lambda: build_personal_stats(user_id, days=days, since=since, points=points))
+
+@app.route('/api/leaderboard')
+def api_leaderboard():
+    if "user_id" not in session:
+        return {"error": "unauthorized"}, 401
+    sort = request.args.get("sort", "streak")
+    page = request.args.get("page", 1, type=int)
+    return json_payload("leaderboard", sort, page, build=lambda: build_leaderboard(sort=sort, page=page))
 
+@app.route('/api/standings')
+def api_standings():
+    if "user_id" not in session:
+        return {"error": "unauthorized"}, 401
+    day = day_arg()
+    if day:
+        return json_payload("standings_day", day, build=lambda: standings_for_day(day))
+    range_ = request.args.get("range", "week")
+    sort = request.args.get("sort", "wins")
+    page = request.args.get("page", 1, type=int)
+    return json_payload("standings", range_, sort, page,
+                        build=lambda: build_standings(range_, sort=sort, page=page))
+
+@app.route('/events')
+def events():
+    if not LIVE_EVENTS:
+        abort(404)
+    if "user_id" not in session:
+        return {"error": "unauthorized"}, 401
+    topics = set(request.args.get("topics", "leaderboard,stats").split(","))
+    # EventSource manda Last-Event-ID solo al reconectar
+    last_id = request.headers.get("Last-Event-ID", type=int)
+    return app.response_class(
+        event_stream(last_id, topics),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route('/admin/export/<table>')
+def admin_export(table):
+    if not is_admin():
+        return {"error": "forbidden"}, 403
+    if table not in IMPORT_VALIDATORS:
+        abort(404)
+    fmt = "ndjson" if request.args.get("format") == "ndjson" else "csv"
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "text/csv"
+    response = app.response_class(stream_with_context(export_lines(table, fmt)), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={table}.{fmt}"
+    return response
+
+@app.route('/cache/stats')
+def cache_stats():
+    if not is_admin():
+        return {"error": "forbidden"}, 403
+    return {
+        "backend": type(cache).__name__,
+        "hits": cache.hits,
+        "misses": cache.misses,
+        "data_version": data_version(),
+    }
+
+@app.route('/metrics')
+def metrics():
+    if not is_admin():
+        return {"error": "forbidden"}, 403
+    return metrics_summary()
+
+@app.route('/cron/backfill')
+def cron_backfill():
+    # Vercel Cron manda "Authorization: Bearer $CRON_SECRET"
+    secret = os.environ.get("CRON_SECRET")
+    if not secret or request.headers.get("Authorization") != f"Bearer {secret}":
+        return {"error": "unauthorized"}, 401
+    return {"inserted": fill_missing_results()}
 
 @app.route('/logout')
 def logout():
     session.pop("user_id", None)
+    session.pop("badge", None)
     return redirect(url_for("index"))
 
-# Crear tablas al iniciar
-with app.app_context():
-    db.create_all()
+instrument_app()
+
+# Las tablas se crean con "flask --app index init-db" (no al importar: cada cold start pagaba el DDL)
+@app.cli.command("init-db")
+def init_db_command():
+    migrate_schema()
+    print("Base de datos lista")
+
+# DB_WARMUP=1: abrir una conexión al importar para que el primer request no pague el handshake
+if env_flag("DB_WARMUP"):
+    with app.app_context():
+        with db.engine.connect() as conn:
+            conn.execute(db.text("SELECT 1"))
 
 if __name__ == "__main__":
+    with app.app_context():
+        migrate_schema()
     app.run(debug=True)
@@ -28,6 +28,7 @@ with app.app_context():
             db.session.add(Stamp(**s))
 
     db.session.commit()
+    # los procesos ya en marcha ven el catálogo nuevo tras STAMP_CATALOG_TTL (ver stamp_catalog en index.py)
     print("✅ Estampillas insertadas correctamente!")
 
    
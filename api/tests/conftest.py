@@ -0,0 +1,103 @@
+# Tests con SQLite en un archivo temporal (los de concurrencia usan varios hilos) y datos chicos:
+#   cd api && python -m pytest -q
+# Los números (tiempos, filas/s) quedan en bench.py.
+import os
+import sys
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+_tmp = tempfile.mkdtemp(prefix="pips-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/tests.db"
+# hash barato: los tests de login no miden el costo de scrypt
+os.environ["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:1000"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import pytz
+from flask.testing import FlaskClient
+from sqlalchemy import event
+
+import index
+from index import app, db, DIFFICULTIES, STAMP_RULES, User, Result, Stamp, UserStamp
+
+
+class IsolatedClient(FlaskClient):
+    # cada request con su propio contexto de app (y su propio g), como en el servidor
+    def open(self, *args, **kwargs):
+        with self.application.app_context():
+            return super().open(*args, **kwargs)
+
+
+app.test_client_class = IsolatedClient
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(db.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def paris_today():
+    return datetime.now(pytz.timezone("Europe/Paris")).date()
+
+
+@pytest.fixture(autouse=True)
+def app_context():
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        index.cache = index.LRUCache()
+        index.login_limiter = index.SlidingWindowLimiter()
+        index.broker = index.EventBroker()
+        index.invalidate_stamp_catalog()
+        yield
+        db.session.remove()
+
+
+def seed(n_users, n_days, seed_value=0):
+    # n_users usuarios con resultados completos los n_days días anteriores a hoy (Paris)
+    rnd = random.Random(seed_value)
+    today = paris_today()
+    stamps = [Stamp(name=name, image="racha_facil", description="-", category=1) for name in STAMP_RULES]
+    db.session.add_all(stamps)
+    users = [User(username=f"user{i}", password_hash="-", current_streak=rnd.randint(0, 60),
+                  last_played=today - timedelta(days=1)) for i in range(n_users)]
+    db.session.add_all(users)
+    db.session.flush()
+
+    results = []
+    for u in users:
+        for d in range(1, n_days + 1):
+            for diff in DIFFICULTIES:
+                total = rnd.randint(5, 600)
+                results.append({"user_id": u.id, "difficulty": diff, "date": today - timedelta(days=d),
+                                "minutes": total // 60, "seconds": total % 60})
+        for s in rnd.sample(stamps, rnd.randint(0, len(stamps) // 2)):
+            db.session.add(UserStamp(user_id=u.id, stamp_id=s.id))
+    if results:
+        db.session.execute(Result.__table__.insert(), results)
+    db.session.commit()
+    index.rebuild_rollup()
+
+
+def client_for(user_id=None):
+    client = app.test_client()
+    if user_id is not None:
+        with client.session_transaction() as sess:
+            sess["user_id"] = user_id
+    return client
+
+
+# envío completo del día (los tres tiempos)
+FULL_DAY = {"easy_sec": "21", "medium_sec": "41", "hard_min": "1", "hard_sec": "6"}
@@ -0,0 +1,50 @@
+import statistics
+from datetime import timedelta
+
+import index
+from index import db, DIFFICULTIES, Result, fill_missing_results
+from conftest import QueryCounter, seed, paris_today
+
+
+def test_analytics_match_naive_python():
+    seed(8, 12)
+    # un día con ausentes: el backfill les pone el peor tiempo y no debe mover las medianas
+    day = paris_today() - timedelta(days=13)
+    db.session.execute(Result.__table__.insert(), [
+        {"user_id": user_id, "difficulty": diff, "date": day, "minutes": 0, "seconds": 30}
+        for user_id in (1, 2) for diff in DIFFICULTIES
+    ])
+    db.session.commit()
+    fill_missing_results(day)
+
+    rows = db.session.query(Result.user_id, Result.difficulty, Result.date,
+                            Result.minutes * 60 + Result.seconds).filter(Result.backfilled.is_(False)).all()
+    by_day, by_user = {}, {}
+    for user_id, diff, d, total in rows:
+        by_day.setdefault((d, diff), []).append(total)
+        by_user.setdefault((user_id, diff), []).append((d, total))
+
+    ids = list(range(1, 9))
+    with QueryCounter() as qc:
+        analytics = index.user_analytics(ids)
+    assert qc.count == 1
+    medians = index.user_analytics(ids, ranks=False)
+    assert all(medians[u][d]["median"] == analytics[u][d]["median"] for u in medians for d in medians[u])
+
+    for (user_id, diff), played in by_user.items():
+        a = analytics[user_id][diff]
+        totals = sorted(t for _, t in played)
+        assert a["best"] == totals[0] and a["results"] == len(totals)
+        assert abs(a["median"] - statistics.median(totals)) < 1e-9
+        assert abs(a["p90"] - index.percentile_cont(totals, 0.9)) < 1e-9
+        last_day, last_total = max(played)
+        assert a["rank"] == 1 + sum(t < last_total for t in by_day[(last_day, diff)])
+        assert a["players"] == len(by_day[(last_day, diff)])
+        beaten = [
+            sorted(by_day[(d, diff)]).index(t) / (len(by_day[(d, diff)]) - 1) if len(by_day[(d, diff)]) > 1 else 0
+            for d, t in played
+        ]
+        assert abs(a["percentile"] - round(100 * (1 - sum(beaten) / len(beaten)), 1)) <= 0.1
+
+    with_backfill = index.user_analytics([3], exclude_backfilled=False)[3]["Easy"]
+    assert with_backfill["results"] == analytics[3]["Easy"]["results"] + 1
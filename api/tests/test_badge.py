@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+
+import index
+from index import db, recent_requests, User
+from conftest import seed, client_for, FULL_DAY
+
+
+def badge_of(client):
+    with client.session_transaction() as sess:
+        return sess["badge"]
+
+
+def test_warm_badge_costs_no_query():
+    seed(3, 2)
+    client = client_for(1)
+    client.get("/dashboard")
+    client.get("/dashboard")
+    assert recent_requests[-1]["queries"] == 0
+
+
+def test_next_backfill_is_the_next_cron_run():
+    before = datetime(2026, 3, 1, 22, 0, tzinfo=timezone.utc)
+    after = datetime(2026, 3, 1, 23, 30, tzinfo=timezone.utc)
+    assert index.next_backfill(before) == datetime(2026, 3, 1, 23, 10, tzinfo=timezone.utc)
+    assert index.next_backfill(after) == datetime(2026, 3, 2, 23, 10, tzinfo=timezone.utc)
+
+
+def test_badge_is_rebuilt_after_the_backfill(monkeypatch):
+    seed(3, 2)
+    client = client_for(1)
+    client.get("/dashboard")
+    valid_until = badge_of(client)["valid_until"]
+    User.query.filter_by(id=1).update({"current_streak": 99})
+    db.session.commit()
+    client.get("/dashboard")
+    assert badge_of(client)["streak"] != 99
+    monkeypatch.setattr(index.time, "time", lambda: valid_until)
+    client.get("/dashboard")
+    assert badge_of(client)["streak"] == 99
+
+
+def test_cached_view_notices_a_submit_from_another_device():
+    seed(3, 2)
+    client = client_for(1)
+    client.get("/leaderboard")
+    streak = badge_of(client)["streak"]
+    client_for(1).post("/submit", data=FULL_DAY)
+    client.get("/leaderboard")
+    assert badge_of(client)["streak"] == streak + 1
@@ -0,0 +1,59 @@
+import pytest
+
+import index
+from index import fill_missing_results
+from conftest import seed, client_for, paris_today, FULL_DAY
+
+PAGES = ["/api/leaderboard", "/api/stats?points=180", "/api/personalstats?days=30",
+         "/leaderboard", "/standings?range=week"]
+
+
+class FakeRedis:
+    # sustituto local de Redis para SharedCache: get/set sobre un dict, valores en bytes como redis-py
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode() if isinstance(value, str) else value
+
+
+def fetch(client):
+    responses = [client.get(page) for page in PAGES]
+    assert [r.status_code for r in responses] == [200] * len(PAGES)
+    return [r.get_json() if r.is_json else r.get_data(as_text=True) for r in responses]
+
+
+def run_pages(backend):
+    seed(5, 4)
+    index.cache = backend
+    client = client_for(1)
+    first = fetch(client)
+    misses, hits = backend.misses, backend.hits
+    assert misses > 0
+    assert fetch(client) == first
+    assert backend.misses == misses and backend.hits > hits, "sin hit en el segundo request"
+
+    client.post("/submit", data=FULL_DAY)
+    fetch(client)
+    assert backend.misses > misses, "sin miss después de /submit"
+    misses = backend.misses
+    fetch(client)
+    fill_missing_results(day=paris_today())
+    fetch(client)
+    assert backend.misses > misses, "sin miss después del backfill"
+    return fetch(client)
+
+
+@pytest.fixture
+def local_pages():
+    return run_pages(index.LRUCache())
+
+
+def test_shared_backend_returns_same_payloads(local_pages):
+    index.db.drop_all()
+    index.db.create_all()
+    index.invalidate_stamp_catalog()
+    assert run_pages(index.SharedCache(FakeRedis())) == local_pages
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import index
+from index import recent_requests
+from conftest import seed, client_for, FULL_DAY
+
+
+def submit_queries(watchers):
+    # consultas del envío mientras `watchers` hilos esperan en el broker
+    ready = threading.Barrier(watchers + 1)
+    received = []
+
+    def watch():
+        events = index.broker.listen(heartbeat=30)
+        topics = set()
+        ready.wait()
+        for event in events:
+            if event is not None:
+                topics.add(event[1])
+            if topics >= {"leaderboard", "stats"}:
+                break
+        events.close()
+        received.append(topics)
+
+    threads = [threading.Thread(target=watch) for _ in range(watchers)]
+    for t in threads:
+        t.start()
+    ready.wait()
+    time.sleep(0.05)  # que todos estén esperando en el broker
+    user_id = watchers + 1
+    assert client_for(user_id).post("/submit", data=FULL_DAY).status_code == 302
+    for t in threads:
+        t.join()
+    assert len(received) == watchers
+    return recent_requests[-1]["queries"]
+
+
+def test_submit_queries_do_not_depend_on_watchers():
+    seed(30, 2)
+    client_for(30).post("/submit", data=FULL_DAY)  # catálogo de estampillas en memoria
+    assert len({submit_queries(n) for n in (0, 5, 25)}) == 1
+
+
+def test_reconnect_replays_missed_events():
+    last = index.broker.last_id
+    for i in range(3):
+        index.broker.publish("stats", {"i": i})
+    replay = index.broker.listen(last)
+    assert [next(replay)[0] for _ in range(3)] == [last + 1, last + 2, last + 3]
+    replay.close()
+
+
+def test_reconnect_outside_backlog_resets():
+    small = index.EventBroker(backlog=2)
+    for i in range(5):
+        small.publish("stats", {"i": i})
+    stale = small.listen(1)
+    assert next(stale)[1] == "reset"
+    stale.close()
+
+
+def test_events_route_sends_missed_events():
+    seed(1, 1)
+    last = index.broker.last_id
+    index.broker.publish("stats", {"i": 0})
+    response = client_for(1).get("/events?topics=stats", headers={"Last-Event-ID": str(last)}, buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b"retry:")
+    assert next(chunks).startswith(f"id: {last + 1}\nevent: stats".encode())
+    response.close()
+
+
+def test_idle_listen_stops_at_deadline():
+    # sin novedades el stream cierra en el límite, no en el heartbeat siguiente
+    start = time.monotonic()
+    events = list(index.broker.listen(heartbeat=0.8, deadline=start + 1))
+    elapsed = time.monotonic() - start
+    assert events == [None]
+    assert 1 <= elapsed < 1.2
+
+
+def test_pages_open_event_source_only_with_live_events(monkeypatch):
+    seed(1, 1)
+    client = client_for(1)
+    for page in ("/leaderboard", "/stats"):
+        assert b"watchEvents(" in client.get(page).data
+    monkeypatch.setattr(index, "LIVE_EVENTS", False)
+    for page in ("/leaderboard", "/stats"):
+        html = client.get(page).data
+        assert b"watchEvents(" not in html and b"js/live.js" not in html
+    assert client.get("/events").status_code == 404
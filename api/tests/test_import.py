@@ -0,0 +1,47 @@
+import io
+
+import pytest
+
+import index
+from index import db, User, Result, UserStamp, DailyStanding, ResultRollup, verify_rollup
+from conftest import seed
+
+TABLES = ["results", "streaks", "user_stamps"]
+
+
+def export_all(fmt):
+    return {table: "".join(index.export_lines(table, fmt)) for table in TABLES}
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+def test_export_import_round_trip(fmt):
+    seed(5, 6)
+    exported = export_all(fmt)
+    for model in (UserStamp, DailyStanding, Result, ResultRollup, User):
+        db.session.execute(db.delete(model))
+    db.session.commit()
+
+    for table in TABLES:
+        report = index.import_rows(table, index.read_rows(io.StringIO(exported[table]), fmt), create_users=True)
+        assert not report["errors"] and report["skipped"] == 0, (table, report)
+
+    again = export_all(fmt)
+    assert again["results"] == exported["results"]
+    assert again["user_stamps"] == exported["user_stamps"]
+    # los usuarios se recrean con otros ids: streaks se compara sin orden
+    assert sorted(again["streaks"].splitlines()) == sorted(exported["streaks"].splitlines())
+    assert not verify_rollup()
+
+
+def test_invalid_rows_are_reported():
+    seed(1, 0)
+    rows = [
+        {"username": "user0", "difficulty": "Easy", "date": "2026-01-01", "minutes": "1", "seconds": "2"},
+        {"username": "user0", "difficulty": "Nope", "date": "2026-01-01", "minutes": "1", "seconds": "2"},
+        {"username": "user0", "difficulty": "Easy", "date": "2026-01-02", "minutes": "-1", "seconds": "2"},
+        {"username": "ghost", "difficulty": "Easy", "date": "2026-01-01", "minutes": "1", "seconds": "2"},
+    ]
+    report = index.import_rows("results", rows)
+    assert report["written"] == 1 and report["skipped"] == 1
+    assert [line for line, _ in report["errors"]] == [2, 3]
+    assert not verify_rollup()
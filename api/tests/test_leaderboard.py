@@ -0,0 +1,34 @@
+import pytest
+
+import index
+from index import build_leaderboard
+from conftest import QueryCounter, seed, client_for
+
+
+@pytest.mark.parametrize("sort", list(index.LEADERBOARD_SORT_KEYS))
+def test_query_count_does_not_grow_with_users(sort):
+    counts = set()
+    for n_users in (3, 12):
+        index.db.drop_all()
+        index.db.create_all()
+        seed(n_users, 3)
+        with QueryCounter() as qc:
+            board = build_leaderboard(sort=sort, page=1)
+        assert len(board["data"]) == n_users
+        counts.add(qc.count)
+    # total + página + medianas de la página
+    assert len(counts) == 1 and max(counts) <= 3, counts
+
+
+def test_sort_order():
+    seed(6, 3)
+    rows = build_leaderboard(sort="streak", page=1)["data"]
+    assert [r["streak"] for r in rows] == sorted((r["streak"] for r in rows), reverse=True)
+    rows = build_leaderboard(sort="username", page=1)["data"]
+    assert [r["username"] for r in rows] == sorted(r["username"] for r in rows)
+
+
+def test_username_sort_is_selectable():
+    seed(2, 1)
+    html = client_for(1).get("/leaderboard?sort=username").get_data(as_text=True)
+    assert '<option value="username" selected>' in html
@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from werkzeug.security import generate_password_hash
+
+import index
+from index import db, User
+from conftest import client_for, paris_today
+
+
+def add_user(username, password="secret", method=None):
+    db.session.add(User(username=username, password_hash=generate_password_hash(password, method or index.PASSWORD_HASH_METHOD),
+                        current_streak=0, last_played=paris_today() - timedelta(days=1)))
+    db.session.commit()
+
+
+def login(ip, username, password):
+    return client_for().post("/", data={"username": username, "password": password},
+                             environ_base={"REMOTE_ADDR": ip}).status_code
+
+
+def test_outdated_hash_is_rehashed_once_on_login():
+    add_user("old", method="pbkdf2:sha256:500")
+    assert login("10.0.0.1", "old", "secret") == 302
+    db.session.expire_all()
+    old = User.query.filter_by(username="old").one()
+    assert old.password_hash.startswith(index.password_hash_prefix() + "$")
+    assert not old.password_outdated()
+    rehashed = old.password_hash
+    assert login("10.0.0.1", "old", "secret") == 302
+    db.session.expire_all()
+    assert User.query.filter_by(username="old").one().password_hash == rehashed
+
+
+def test_wrong_password_does_not_rehash():
+    add_user("old", method="pbkdf2:sha256:500")
+    before = User.query.filter_by(username="old").one().password_hash
+    assert login("10.0.0.1", "old", "wrong") == 200
+    db.session.expire_all()
+    assert User.query.filter_by(username="old").one().password_hash == before
+
+
+def test_per_user_limit_is_per_ip():
+    # quien prueba contraseñas desde otra IP no bloquea al dueño de la cuenta
+    add_user("victim")
+    add_user("other")
+    for _ in range(index.LOGIN_MAX_PER_USER):
+        assert login("10.3.0.1", "victim", "wrong") == 200
+    assert login("10.3.0.1", "victim", "secret") == 429
+    assert login("10.3.0.1", "other", "secret") == 302
+    assert login("10.3.1.0", "victim", "secret") == 302
+
+
+def test_username_backstop_across_ips(monkeypatch):
+    monkeypatch.setattr(index, "LOGIN_MAX_PER_USERNAME", 8)
+    add_user("victim")
+    for i in range(8):
+        assert login(f"10.6.0.{i}", "victim", "wrong") == 200
+    assert login("10.6.1.0", "victim", "secret") == 429
+
+
+def test_per_ip_limit():
+    add_user("legit")
+    for i in range(index.LOGIN_MAX_PER_IP):
+        assert login("10.4.0.1", f"nobody{i}", "wrong") == 200
+    response = client_for().post("/", data={"username": "legit", "password": "secret"},
+                                 environ_base={"REMOTE_ADDR": "10.4.0.1"})
+    assert response.status_code == 429 and int(response.headers["Retry-After"]) > 0
+    assert login("10.4.0.2", "legit", "secret") == 302
+
+
+def test_success_clears_user_window():
+    add_user("me")
+    for _ in range(index.LOGIN_MAX_PER_USER - 1):
+        login("10.5.0.1", "me", "wrong")
+    assert login("10.5.0.1", "me", "secret") == 302
+    assert login("10.5.0.1", "me", "wrong") == 200
+
+
+def test_sliding_window_frees_slots(monkeypatch):
+    limiter = index.SlidingWindowLimiter()
+    clock = [100.0]
+    monkeypatch.setattr(index.time, "monotonic", lambda: clock[0])
+    assert limiter.hit("k", 2, 10) == 0
+    clock[0] = 105
+    assert limiter.hit("k", 2, 10) == 0
+    assert limiter.hit("k", 2, 10) == 5
+    clock[0] = 110.5
+    assert limiter.hit("k", 2, 10) == 0
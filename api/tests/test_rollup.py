@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from index import db, DIFFICULTIES, User, Result, DailyStanding, fill_missing_results, rebuild_rollup, verify_rollup
+from conftest import seed, client_for, paris_today, FULL_DAY
+
+
+def test_rollup_matches_full_recompute_after_submits_and_backfill():
+    seed(6, 3)
+    for user_id in range(1, 5):
+        client = client_for(user_id)
+        form = {"easy_sec": str(user_id + 5), "medium_sec": "40"}
+        if user_id % 2:
+            form["hard_min"] = "1"
+        client.post("/submit", data=form)
+        client.post("/submit", data=form)  # doble envío
+    fill_missing_results(day=paris_today())
+    assert not verify_rollup()
+
+
+def test_backfill_keeps_streak_of_user_who_already_finished_today():
+    # el cron corre pasada la medianoche de Paris: quien no completó ayer pero ya terminó hoy
+    # queda con racha 1; quien tampoco jugó hoy, con 0
+    seed(4, 3)
+    today = paris_today()
+    yesterday = today - timedelta(days=1)
+    early, absent = 1, 2
+    Result.query.filter(Result.user_id.in_([early, absent]), Result.date == yesterday,
+                        Result.difficulty == "Hard").delete()
+    User.query.filter(User.id.in_([early, absent])).update(
+        {"current_streak": 7, "last_played": yesterday - timedelta(days=1)})
+    db.session.commit()
+    rebuild_rollup()
+
+    client_for(early).post("/submit", data=FULL_DAY)
+    assert db.session.get(User, early).current_streak == 1
+    fill_missing_results(day=yesterday)
+    db.session.expire_all()
+    streaks = {u.id: (u.current_streak, u.last_played) for u in User.query.filter(User.id.in_([early, absent]))}
+    assert streaks == {early: (1, today), absent: (0, yesterday - timedelta(days=1))}
+    assert not verify_rollup()
+
+
+def test_backfill_fills_worst_time_once():
+    seed(3, 2)
+    yesterday = paris_today() - timedelta(days=1)
+    Result.query.filter(Result.user_id == 3, Result.date == yesterday).delete()
+    db.session.commit()
+    rebuild_rollup()
+    worst = {diff: max(r.minutes * 60 + r.seconds for r in Result.query.filter_by(date=yesterday, difficulty=diff))
+             for diff in ("Easy", "Medium", "Hard")}
+    assert fill_missing_results(day=yesterday) == 3
+    assert fill_missing_results(day=yesterday) == 0
+    filled = {r.difficulty: r.minutes * 60 + r.seconds for r in Result.query.filter_by(user_id=3, date=yesterday)}
+    assert filled == worst
+    assert all(r.backfilled for r in Result.query.filter_by(user_id=3, date=yesterday))
+
+
+def test_backfill_catches_up_on_a_missed_cron_day():
+    # el cron de anteayer no corrió: la corrida de hoy rellena y fotografía los dos días
+    seed(3, 3)
+    yesterday = paris_today() - timedelta(days=1)
+    missed = yesterday - timedelta(days=1)
+    fill_missing_results(day=missed - timedelta(days=1))
+    Result.query.filter(Result.user_id == 3, Result.date.in_([missed, yesterday])).delete()
+    db.session.commit()
+    rebuild_rollup()
+
+    assert fill_missing_results() == 6
+    for day in (missed, yesterday):
+        assert Result.query.filter_by(user_id=3, date=day, backfilled=True).count() == 3
+        assert DailyStanding.query.filter_by(date=day).count() == 3 * len(DIFFICULTIES)
+    assert not verify_rollup()
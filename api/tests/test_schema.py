@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from index import db, Result, UserStamp, migrate_schema
+from conftest import seed, paris_today
+
+
+def plan(stmt):
+    sql = str(stmt.compile(db.engine, compile_kwargs={"literal_binds": True}))
+    return " | ".join(str(row[-1]) for row in db.session.execute(db.text("EXPLAIN QUERY PLAN " + sql)))
+
+
+def test_migrate_schema_restores_indexes_used_by_hot_queries():
+    seed(3, 3)
+    day = paris_today() - timedelta(days=1)
+    hot = [
+        db.select(Result).where(Result.user_id == 1, Result.date == day, Result.difficulty == "Easy"),
+        db.select(Result).where(Result.date == day, Result.difficulty == "Easy"),
+        db.select(UserStamp).where(UserStamp.user_id == 1, UserStamp.stamp_id == 1),
+    ]
+    for model in (Result, UserStamp):
+        for index in model.__table__.indexes:
+            index.drop(db.engine)
+    migrate_schema()
+    for stmt in hot:
+        assert "INDEX" in plan(stmt).upper()
@@ -0,0 +1,17 @@
+import index
+from index import db, Stamp
+
+
+def test_stamp_catalog_reloads_after_ttl(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(index.time, "monotonic", lambda: clock[0])
+    db.session.add(Stamp(name="Racha corta", image="racha_facil", description="-", category=1))
+    db.session.commit()
+    assert list(index.stamp_catalog()) == ["Racha corta"]
+
+    # otro proceso (seed_stamps.py) agrega una: este no se entera hasta el TTL
+    db.session.add(Stamp(name="Precoz", image="medianoche_media", description="-", category=2))
+    db.session.commit()
+    assert list(index.stamp_catalog()) == ["Racha corta"]
+    clock[0] += index.STAMP_CATALOG_TTL + 1
+    assert set(index.stamp_catalog()) == {"Racha corta", "Precoz"}
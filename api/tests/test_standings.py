@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from sqlalchemy import func
+
+import index
+from index import db, DIFFICULTIES, User, Result, DailyStanding, fill_missing_results
+from conftest import seed, client_for, paris_today
+
+
+def test_range_standings_match_results():
+    users, days = 6, 20
+    seed(users, days)
+    index.rebuild_standings()
+    rows = db.session.query(Result.user_id, Result.date, Result.difficulty,
+                            Result.minutes * 60 + Result.seconds, Result.backfilled).all()
+    best = {}
+    for user_id, d, diff, total, backfilled in rows:
+        best[(d, diff)] = min(best.get((d, diff), total), total)
+    names = dict(db.session.query(User.id, User.username))
+    wins, played = {}, {}
+    for user_id, d, diff, total, backfilled in rows:
+        if not backfilled:
+            played.setdefault(names[user_id], set()).add(d)
+            if total == best[(d, diff)]:
+                wins[names[user_id]] = wins.get(names[user_id], 0) + 1
+
+    board = index.build_standings("all", per_page=users)
+    assert len(board["data"]) == users
+    for row in board["data"]:
+        assert row["wins"] == wins.get(row["username"], 0)
+        assert row["days"] == len(played[row["username"]])
+        assert row["streak"] == days  # el seed juega todos los días
+    week = index.build_standings("week", per_page=users)
+    assert all(row["days"] == 7 for row in week["data"])
+
+
+def test_backfill_snapshots_day_once_without_negative_streaks():
+    users = 6
+    seed(users, 2)
+    day = paris_today()
+    db.session.execute(Result.__table__.insert(), [
+        {"user_id": user_id, "difficulty": diff, "date": day, "minutes": 0, "seconds": 10 + user_id}
+        for user_id in range(1, users // 2 + 1) for diff in DIFFICULTIES
+    ])
+    # no jugó `day` pero ya completó el día siguiente antes del backfill: su racha del día es 0
+    early = users // 2 + 1
+    User.query.filter_by(id=early).update({"current_streak": 1, "last_played": day + timedelta(days=1)})
+    db.session.commit()
+    fill_missing_results(day)
+    fill_missing_results(day)
+
+    streaks = dict(db.session.query(DailyStanding.user_id, func.min(DailyStanding.streak))
+                   .filter(DailyStanding.date == day).group_by(DailyStanding.user_id))
+    assert streaks[early] == 0 and min(streaks.values()) >= 0
+    assert DailyStanding.query.filter_by(date=day).count() == users * len(DIFFICULTIES)
+    standings = index.standings_for_day(day)
+    for diff in DIFFICULTIES:
+        assert len(standings[diff]) == users
+        assert standings[diff][0]["username"] == "user0" and standings[diff][0]["rank"] == 1
+        assert all(r["backfilled"] for r in standings[diff][users // 2:])
+
+
+def test_day_view_at_the_date_limits():
+    seed(1, 1)
+    client = client_for(1)
+    first = client.get("/standings?day=0001-01-01")
+    last = client.get("/standings?day=9999-12-31")
+    assert first.status_code == last.status_code == 200
+    assert b"day=0001-01-02" in first.data and b"day=0000" not in first.data
+    assert b"day=9999-12-30" in last.data and b"day=10000" not in last.data
+    assert client.get("/api/standings?day=9999-12-31").status_code == 200
@@ -0,0 +1,79 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+import index
+from index import DIFFICULTIES, build_stats, build_personal_stats
+from conftest import seed, client_for, paris_today
+
+
+def test_downsample_bounds_points_and_keeps_extremes_and_average():
+    seed(3, 60)
+    budget = 20
+    full = build_stats()
+    reduced = build_stats(points=budget)
+    for diff in DIFFICULTIES:
+        originals = {ds["label"]: ds["data"] for ds in full[diff]["datasets"]}
+        for ds in reduced[diff]["datasets"]:
+            values = [p["y"] for p in ds["data"]]
+            original = [v for v in originals[ds["label"]] if v is not None]
+            assert len(values) <= budget
+            if ds.get("average"):
+                assert values[0] == original[0]
+                continue
+            assert min(values) == min(original) and max(values) == max(original)
+
+
+@pytest.mark.parametrize("budget", range(-1, 6))
+def test_small_budgets_are_still_bounded(budget):
+    rnd = random.Random(0)
+    series = [(i, rnd.randint(5, 600)) for i in range(200)]
+    points = index.downsample(series, budget)
+    assert len(points) <= max(budget, 5)
+    assert min(p[1] for p in points) == min(p[1] for p in series)
+    assert max(p[1] for p in points) == max(p[1] for p in series)
+
+
+def test_negative_point_budget_is_rejected():
+    seed(1, 1)
+    client = client_for(1)
+    assert client.get("/api/stats?points=-1").status_code == 400
+    assert client.get("/api/personalstats?points=-1").status_code == 400
+
+
+def test_out_of_range_days_are_rejected():
+    seed(1, 1)
+    client = client_for(1)
+    for page in ("/stats", "/api/stats", "/personalstats", "/api/personalstats"):
+        for days in (-1, 1000000):
+            assert client.get(f"{page}?days={days}").status_code == 400, (page, days)
+        assert client.get(f"{page}?days={index.STATS_MAX_DAYS}").status_code == 200, page
+
+
+def test_personal_stats_days_window():
+    seed(2, 40)
+    today = paris_today()
+    windowed = build_personal_stats(1, days=30)
+    dates = [date.fromisoformat(d) for diff in DIFFICULTIES for d in windowed[diff]["dates"]]
+    assert dates and all(d > today - timedelta(days=30) for d in dates)
+    response = client_for(1).get("/api/personalstats?days=30").get_json()
+    assert all(response[diff]["dates"] == windowed[diff]["dates"] for diff in DIFFICULTIES)
+
+
+def test_empty_delta_keeps_average_value():
+    # delta sin resultados en la ventana: la línea del promedio viene vacía pero con su valor
+    seed(2, 5)
+    averages = index.historical_averages()
+    delta = build_stats(since=paris_today() + timedelta(days=2))
+    for diff in DIFFICULTIES:
+        assert delta[diff]["dates"] == []
+        line = next(ds for ds in delta[diff]["datasets"] if ds.get("average"))
+        assert line["value"] == float(averages[diff])
+
+
+def test_since_returns_only_new_points():
+    seed(2, 5)
+    since = paris_today() - timedelta(days=2)
+    delta = build_stats(since=since)
+    assert all(date.fromisoformat(d) >= since for diff in DIFFICULTIES for d in delta[diff]["dates"])
@@ -0,0 +1,78 @@
+import threading
+from datetime import timedelta
+
+from sqlalchemy import func
+
+from index import db, DIFFICULTIES, User, Result, UserStamp, recent_requests, rebuild_rollup, verify_rollup
+from conftest import seed, client_for, paris_today
+
+# varias pestañas del mismo usuario enviando a la vez: parciales que juntas completan el día
+TABS = [
+    {"easy_sec": "20"},
+    {"medium_sec": "40"},
+    {"hard_min": "1", "hard_sec": "5"},
+    {"easy_sec": "21", "medium_sec": "41", "hard_min": "1", "hard_sec": "6"},
+]
+# lock, snapshot, results, rollup, racha, versión, estampillas, commit (+ catálogo en frío)
+# y después del commit la publicación en /events: fila del leaderboard, medianas y promedios
+SUBMIT_MAX_QUERIES = 12
+
+
+def test_concurrent_tabs_submit_once_and_bump_streak_once():
+    seed(4, 3)
+    today = paris_today()
+    # mitad viene de ayer (la racha sube una vez), mitad cortó (vuelve a 1)
+    for u in User.query:
+        u.last_played = today - timedelta(days=1 if u.id % 2 else 3)
+    db.session.commit()
+    rebuild_rollup()
+    before = {u.id: (u.current_streak, u.last_played) for u in User.query}
+    db.session.remove()
+
+    n_requests = len(recent_requests)
+    barrier = threading.Barrier(len(before) * len(TABS))
+    statuses, errors = [], []
+
+    def post(user_id, form):
+        try:
+            client = client_for(user_id)
+            barrier.wait()
+            statuses.append(client.post("/submit", data=form).status_code)
+        except Exception as e:
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=post, args=(user_id, form)) for user_id in before for form in TABS]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors, errors[:3]
+    assert statuses.count(302) == len(threads)
+    per_user = db.session.query(Result.user_id, Result.difficulty, func.count()).filter(Result.date == today) \
+        .group_by(Result.user_id, Result.difficulty).all()
+    assert len(per_user) == len(before) * len(DIFFICULTIES)
+    assert all(n == 1 for _, _, n in per_user), "resultado duplicado"
+    for u in User.query:
+        streak, last_played = before[u.id]
+        expected = streak + 1 if last_played == today - timedelta(days=1) else 1
+        assert (u.current_streak, u.last_played) == (expected, today), u.id
+    stamps = db.session.query(UserStamp.user_id, UserStamp.stamp_id).all()
+    assert len(stamps) == len(set(stamps)), "estampilla duplicada"
+    assert not verify_rollup()
+
+    posts = [r["queries"] for r in list(recent_requests)[n_requests:] if r["endpoint"] == "submit"]
+    assert max(posts) <= SUBMIT_MAX_QUERIES
+
+
+def test_partial_submit_keeps_streak_until_day_is_complete():
+    seed(1, 2)
+    user = db.session.get(User, 1)
+    streak = user.current_streak
+    client = client_for(1)
+    client.post("/submit", data={"easy_sec": "20"})
+    db.session.expire_all()
+    assert db.session.get(User, 1).current_streak == streak
+    client.post("/submit", data={"medium_sec": "40", "hard_min": "1"})
+    db.session.expire_all()
+    assert db.session.get(User, 1).current_streak == streak + 1
@@ -0,0 +1,216 @@
+// Gráficos de stats.html y personalstats.html.
+// Los datos vienen de la API JSON: la historia se guarda en localStorage y
+// en cada visita solo se piden los puntos nuevos (?since=<última fecha>).
+// Si la historia supera el presupuesto de puntos, el servidor la reduce (LTTB)
+// y ya no se guarda: se pide completa y el navegador revalida con el ETag.
+
+function pad(n){ return (n<10?'0':'') + n; }
+function secondsToMMSS(s) {
+  if (s === null || s === undefined) return null;
+  const m = Math.floor(s / 60);
+  const sec = s % 60;
+  return `${pad(m)}:${pad(sec)}`;
+}
+
+const palette = [
+  "#1f77b4", // azul
+  "#ff7f0e", // naranja
+  "#2ca02c", // verde
+  "#d62728", // rojo
+  "#9467bd", // morado
+  "#8c564b", // marrón
+  "#e377c2", // rosa
+  "#7f7f7f", // gris
+  "#bcbd22", // amarillo oliva
+  "#17becf", // cian
+];
+function getColor(index) { return palette[index % palette.length]; }
+
+function chartDataset(ds, i) {
+  return {
+    label: ds.label,
+    data: ds.data,
+    spanGaps: false,
+    borderColor: ds.borderColor || getColor(i),
+    backgroundColor: ds.backgroundColor || getColor(i),
+    borderDash: ds.borderDash || [],
+    tension: ds.tension !== undefined ? ds.tension : 0.25,
+    pointRadius: ds.pointRadius !== undefined ? ds.pointRadius : 3,
+  };
+}
+
+function buildChart(canvasId, payload) {
+  const ctx = document.getElementById(canvasId);
+  const labels = payload.labels;
+  const datasets = payload.datasets.map(chartDataset);
+
+  return new Chart(ctx, {
+    type: 'line',
+    data: { labels, datasets },
+    options: {
+      responsive: true,
+      maintainAspectRatio: false,
+      scales: {
+        y: {
+          min: 0,
+          ticks: {
+            callback: function(value) { return secondsToMMSS(value); }
+          },
+          title: { display: true, text: "Tiempo" }
+        },
+        x: { title: { display: true, text: "Fecha" } }
+      },
+      plugins: {
+        tooltip: {
+          callbacks: {
+            label: function(ctx) {
+              const v = ctx.parsed.y;
+              return `${ctx.dataset.label}: ${secondsToMMSS(v)}`;
+            }
+          }
+        },
+        legend: { position: 'bottom' }
+      },
+      elements: { line: { borderWidth: 2 } }
+    }
+  });
+}
+
+// Agrega un delta (fechas >= since) a una dificultad ya guardada
+function mergeDiff(old, delta) {
+  const index = new Map(old.dates.map((d, i) => [d, i]));
+  const positions = delta.dates.map((d, j) => {
+    if (!index.has(d)) {
+      index.set(d, old.dates.length);
+      old.dates.push(d);
+      old.labels.push(delta.labels[j]);
+    }
+    return index.get(d);
+  });
+  const length = old.dates.length;
+
+  for (const ds of delta.datasets) {
+    let target = old.datasets.find(o => o.label === ds.label);
+    if (!target) {
+      target = Object.assign({}, ds, { data: [] });
+      old.datasets.push(target);
+    }
+    if (ds.average) {
+      // el promedio histórico cambia con cada punto nuevo: se reemplaza entero
+      // (con `value`: un delta sin fechas trae la línea vacía)
+      const avg = ds.value !== undefined ? ds.value : ds.data[0];
+      if (avg !== undefined && avg !== null) target.data = new Array(length).fill(avg);
+      continue;
+    }
+    ds.data.forEach((v, j) => { target.data[positions[j]] = v; });
+  }
+  for (const ds of old.datasets) {
+    while (ds.data.length < length) ds.data.push(null);
+    for (let i = 0; i < length; i++) if (ds.data[i] === undefined) ds.data[i] = null;
+  }
+  return old;
+}
+
+function dayBefore(iso) {
+  const d = new Date(iso + "T00:00:00Z");
+  d.setUTCDate(d.getUTCDate() - 1);
+  return d.toISOString().slice(0, 10);
+}
+
+function lastDate(payload) {
+  let last = null;
+  for (const diff of Object.keys(payload)) {
+    const dates = payload[diff].dates;
+    if (dates.length && (!last || dates[dates.length - 1] > last)) last = dates[dates.length - 1];
+  }
+  return last;
+}
+
+function isDownsampled(payload) {
+  return Object.values(payload).some(p => p.downsampled);
+}
+
+function longestSeries(payload) {
+  return Math.max(0, ...Object.values(payload).map(p => p.dates.length));
+}
+
+// Carga los datos de `url` usando lo guardado en localStorage bajo `storageKey`
+// (sin storageKey pide todo; el navegador igual revalida con el ETag)
+async function loadChartData(url, storageKey, budget) {
+  if (!storageKey) {
+    const response = await fetch(url, { credentials: "same-origin" });
+    return response.json();
+  }
+
+  let stored = null;
+  try { stored = JSON.parse(localStorage.getItem(storageKey)); } catch (e) { stored = null; }
+
+  // desde el día anterior al último guardado: el backfill rellena el día anterior después de medianoche
+  const last = stored && lastDate(stored.payload);
+  const since = last && dayBefore(last);
+  if (stored && since) {
+    const headers = stored.etag ? { "If-None-Match": stored.etag } : {};
+    const sep = url.includes("?") ? "&" : "?";
+    const response = await fetch(`${url}${sep}since=${since}`, { headers, credentials: "same-origin" });
+    if (response.status === 304) return stored.payload;
+    if (response.ok) {
+      const delta = await response.json();
+      for (const diff of Object.keys(delta)) {
+        stored.payload[diff] = stored.payload[diff] ? mergeDiff(stored.payload[diff], delta[diff]) : delta[diff];
+      }
+      if (!budget || longestSeries(stored.payload) <= budget) {
+        save(storageKey, stored.payload, response.headers.get("ETag"));
+        return stored.payload;
+      }
+    }
+  }
+
+  const response = await fetch(url, { credentials: "same-origin" });
+  const payload = await response.json();
+  if (isDownsampled(payload)) {
+    localStorage.removeItem(storageKey);
+  } else {
+    save(storageKey, payload, null);  // el ETag de la respuesta completa no sirve para el delta
+  }
+  return payload;
+}
+
+function save(storageKey, payload, etag) {
+  try {
+    localStorage.setItem(storageKey, JSON.stringify({ payload, etag }));
+  } catch (e) {
+    // sin espacio: la próxima visita vuelve a pedir todo
+  }
+}
+
+// Aplica al gráfico ya dibujado un payload que cambió (ej. después de mergeDiff)
+function updateChart(chart, payload) {
+  chart.data.labels = payload.labels;
+  payload.datasets.forEach((ds, i) => {
+    const current = chart.data.datasets.find(c => c.label === ds.label);
+    if (current) current.data = ds.data;
+    else chart.data.datasets.push(chartDataset(ds, i));
+  });
+  chart.update();
+}
+
+async function renderCharts(url, storageKey, budget) {
+  const dataByDiff = await loadChartData(url, storageKey, budget);
+  const charts = {};
+  for (const diff of Object.keys(dataByDiff)) {
+    charts[diff] = buildChart(`chart_${diff}`, dataByDiff[diff]);
+  }
+  return { charts, dataByDiff };
+}
+
+// Puntos nuevos que llegan por /events (mismo formato que un delta de la API).
+// Los gráficos reducidos con LTTB no se tocan: se actualizan en la próxima visita.
+function applyLiveStats(rendered, delta) {
+  for (const diff of Object.keys(delta)) {
+    const payload = rendered.dataByDiff[diff];
+    const chart = rendered.charts[diff];
+    if (!payload || !chart || payload.downsampled) continue;
+    mergeDiff(payload, delta[diff]);
+    updateChart(chart, payload);
+  }
+}
@@ -0,0 +1,12 @@
+// Actualizaciones en vivo desde /events (Server-Sent Events).
+// EventSource reconecta solo y manda Last-Event-ID, así que no se pierden eventos
+// mientras sigan en el backlog del servidor; si no, llega "reset" y se recarga la página.
+
+function watchEvents(url, handlers) {
+  const source = new EventSource(url);
+  for (const [topic, handler] of Object.entries(handlers)) {
+    source.addEventListener(topic, (event) => handler(JSON.parse(event.data)));
+  }
+  source.addEventListener("reset", () => window.location.reload());
+  return source;
+}